@@ -0,0 +1,92 @@
+"""
+File name: motion_history.py
+Author: Yerbol Aussat
+Python Version: 2.7
+
+MotionHistory class keeps a history of the last motion values (1 or 0) from a PIR sensor, and their occupancy score.
+
+Occupancy score is a discounted sum of motion values: score = sum(motion[i] * discount_factor**i), where motion[0] is the
+most recent value. The history is stored in a fixed-size ring buffer, and the score is updated incrementally, so both
+adding a sample and getting the score take O(1) time.
+
+EdgeMotionHistory is fed by PIR sensor's edge events instead of periodic samples (see omega_module.py).
+"""
+
+from array import array
+
+
+class MotionHistory:
+	def __init__(self, size, discount_factor):
+		self.size = size
+		self.discount_factor = discount_factor
+		self.samples = array('B', [0] * size)  # Ring buffer of motion values.
+		self.next_index = 0  # Position in the ring buffer where the next motion value is stored.
+		self.length = 0  # Number of motion values in the history.
+		self.score = 0.0
+		# Weight of a motion value at the moment it drops out of the history.
+		self.dropped_weight = discount_factor ** size
+
+	def __len__(self):
+		return self.length
+
+	# Add the most recent motion value to the history (if the history is full, the oldest value is dropped).
+	def add(self, motion):
+		dropped_motion = self.samples[self.next_index] if self.length == self.size else 0
+		self.samples[self.next_index] = motion
+		self.next_index = (self.next_index + 1) % self.size
+		self.length = min(self.length + 1, self.size)
+
+		# All previous values get one more discount factor, and the contribution of the dropped value is subtracted.
+		self.score = motion + self.discount_factor * self.score - dropped_motion * self.dropped_weight
+		# Once per cycle of the ring buffer, recompute the score from scratch, so that floating point errors don't
+		# accumulate (amortized cost is still O(1)).
+		if self.next_index == 0:
+			self.score = self.compute_score()
+
+	# Get motion values, from the most recent to the oldest.
+	def get_motion_values(self):
+		return [self.samples[(self.next_index - 1 - i) % self.size] for i in range(self.length)]
+
+	# Compute occupancy score from scratch (O(size)).
+	def compute_score(self):
+		score = 0
+		alpha = self.discount_factor
+		for i, motion in enumerate(self.get_motion_values()):
+			score += motion * alpha**i
+		return score
+
+	# Add the same motion value count times (O(min(count, size))).
+	def add_repeated(self, motion, count):
+		# Once the history is full, adding more values equal to motion doesn't change the result.
+		for _ in range(min(count, self.size)):
+			self.add(motion)
+
+
+# EdgeMotionHistory is a motion history that is updated on PIR sensor's edge events (i.e., when its value changes),
+# rather than by sampling the sensor every sampling_period seconds. To keep the same occupancy score semantics, the
+# sample slots that elapsed since the previous update are replayed with the sensor's value during these slots. If motion
+# was detected (rising edge) during a slot, the slot's value is 1, even if the sensor's value dropped before its end.
+class EdgeMotionHistory(MotionHistory):
+	def __init__(self, size, discount_factor, sampling_period, timestamp):
+		MotionHistory.__init__(self, size, discount_factor)
+		self.sampling_period = sampling_period
+		self.last_slot_time = timestamp  # Time of the last sample slot that was added to the history.
+		self.level = 0  # Current value of the PIR sensor.
+		self.motion_latched = False  # Whether motion was detected after the last sample slot.
+
+	# Add sample slots that elapsed before the given time.
+	def catch_up(self, timestamp):
+		elapsed_slots = int((timestamp - self.last_slot_time) / self.sampling_period)
+		if elapsed_slots <= 0:
+			return
+		self.add(1 if self.level or self.motion_latched else 0)
+		self.add_repeated(self.level, elapsed_slots - 1)
+		self.last_slot_time += elapsed_slots * self.sampling_period
+		self.motion_latched = False
+
+	# Update the PIR sensor's value (on an edge event that happened at the given time).
+	def update_level(self, level, timestamp):
+		self.catch_up(timestamp)
+		if level and not self.level:
+			self.motion_latched = True
+		self.level = level
@@ -0,0 +1,56 @@
+"""
+File name: benchmark_tsl2561.py
+Author: Yerbol Aussat
+Python Version: 2.7
+
+Benchmark of a TSL-2561 light sensor. For each integration time, the script reports:
+- I2C reads per second when both channels are read in one transaction (burst read) and in two transactions;
+- Samples per second, i.e., how often the sensor provides a fresh sample (a new integration cycle).
+"""
+
+import time
+from tsl2561 import TSL2561
+
+# Constants
+BENCHMARK_DURATION = 5  # seconds per measurement
+
+
+# Get number of I2C reads per second.
+def measure_read_rate(tsl, duration):
+	n_reads = 0
+	start = time.time()
+	while time.time() - start < duration:
+		tsl.read_raw_channels()
+		n_reads += 1
+	return n_reads / (time.time() - start)
+
+
+# Get number of fresh samples per second. Values of a sample don't change until the next integration cycle ends, so
+# a change of values is counted as a new sample (in stable light, this underestimates the sample rate).
+def measure_sample_rate(tsl, duration):
+	n_samples = 0
+	prev_values = tsl.read_raw_channels()
+	start = time.time()
+	while time.time() - start < duration:
+		values = tsl.read_raw_channels()
+		if values != prev_values:
+			n_samples += 1
+			prev_values = values
+	return n_samples / (time.time() - start)
+
+
+if __name__ == '__main__':
+	tsl = TSL2561()
+	print "{:<16} {:>10} {:>18} {:>18} {:>16}".format(
+		"Integration", "Time (ms)", "Burst reads/s", "Two-part reads/s", "Samples/s")
+	for integration_time in [TSL2561.IntegrationTime.Fast, TSL2561.IntegrationTime.Medium, TSL2561.IntegrationTime.Slow]:
+		tsl.set_timing(integration_time, TSL2561.Gain.Low)
+		time.sleep(tsl.get_integration_seconds())
+		tsl.burst = True
+		burst_read_rate = measure_read_rate(tsl, BENCHMARK_DURATION)
+		sample_rate = measure_sample_rate(tsl, BENCHMARK_DURATION)
+		tsl.burst = False
+		split_read_rate = measure_read_rate(tsl, BENCHMARK_DURATION)
+		print "{:<16} {:>10.1f} {:>18.1f} {:>18.1f} {:>16.2f}".format(
+			integration_time.name, tsl.get_integration_seconds() * 1000, burst_read_rate, split_read_rate, sample_rate)
+	tsl.set_timing(TSL2561.IntegrationTime.Slow, TSL2561.Gain.Low)
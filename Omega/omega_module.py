@@ -7,7 +7,21 @@ Stationary "Per-desk" sensing module.
 
 In the current implementation, all "per-desk" sensing modules should be started before running the main controller.
 
-This process sends (light reading , occupancy reading) to the control module (RPi), whenever RPi requests it.
+This process sends (light reading , occupancy reading) to the control module (RPi), whenever RPi requests it. If RPi
+subscribes to sensor readings ("Subscribe <rate>"), (timestamp, light reading, occupancy reading) frames are pushed to it
+at the requested rate over the same connection, until RPi sends the next message.
+
+Both the binary protocol (see sensing_protocol.py) and the legacy text protocol are supported.
+
+By default, PIR sensor is polled every MOTION_HISTORY_UPDATE_FREQUENCY seconds. With the "--edge_triggered" option, the
+process waits for PIR sensor's edge events instead, so motion is registered without delay, and no CPU time is spent on
+polling when nothing changes.
+
+Light sensor is sampled by a background thread, and requests are answered with the latest sample, so I2C transactions
+(and their errors) are not on the request path. The "--light_window" option sets the number of light samples that are
+averaged. Light sensor integrates for 101 ms (LIGHT_INTEGRATION_TIME), so readings change every ~0.1 s, and the control
+module can detect when illuminance settles after dimming (see RPi/settle_detection.py) within about a second; the
+"--slow_integration" option sets the default 402 ms integration time (higher resolution, but settling takes ~2 s).
 
 TODO: Send (light reading , occupancy reading, user lux preference) to the control module. This way target illuminance
 on the sensor could be inferred at the control module based on the provided user lux preference and occupancy.
@@ -16,22 +30,33 @@ User lux preference could be inputted by a user (like in omega_portable_module.p
 
 import time
 import socket
+import select
+import argparse
 import threading
 from onionGpio import OnionGpio
 from tsl2561 import TSL2561
+from motion_history import MotionHistory
+from motion_history import EdgeMotionHistory
+import sensing_protocol as protocol
 
 # Constants
 MOTION_HISTORY_SIZE = 500
 MOTION_HISTORY_UPDATE_FREQUENCY = 0.15
 DISCOUNT_FACTOR = 0.995  # discount factor for calculating the occupancy score
-
-
-# Initialize light and PIR sensors.
-def initialize_sensors():
-	tsl = TSL2561()
+OCCUPANCY_SCORE_THRESHOLD = 0.8  # the area is considered occupied if the occupancy score reaches this value
+DEFAULT_PUSH_RATE = 10  # frames per second pushed to a subscribed client (if the rate is not specified)
+PIR_PIN = 1
+GPIO_SYSFS_PATH = '/sys/class/gpio/gpio{}/'
+EDGE_WAIT_TIMEOUT = 5  # maximum time (in seconds) between motion history updates in edge-triggered mode
+LIGHT_SAMPLING_PERIOD = 0.1  # seconds
+LIGHT_INTEGRATION_TIME = TSL2561.IntegrationTime.Medium
+
+
+# Initialize light (with the given integration time) and PIR sensors.
+def initialize_sensors(integration_time=LIGHT_INTEGRATION_TIME):
+	tsl = TSL2561(integration_time)
 	print "[*] Light sensor is initialized"
-	pin = 1
-	pir = OnionGpio(pin)
+	pir = OnionGpio(PIR_PIN)
 	pir_status = pir.setInputDirection()
 	print "[*] PIR sensor is initialized: ", pir_status
 	return tsl, pir
@@ -40,48 +65,72 @@ def initialize_sensors():
 # Thread that keeps updating motion history queue. The updating frequency is specified in
 # the MOTION_HISTORY_UPDATE_FREQUENCY constant.
 def update_motion_history():
-	global motion_history
 	while True:
 		# Read from PIR sensor
 		try:
 			occupancy_reading = int(pir.getValue())
-			# Update motion history:
+			# Update motion history (and occupancy score, in O(1)):
 			with lock:
-				if len(motion_history) >= MOTION_HISTORY_SIZE:
-					motion_history.pop()
-				motion_history.insert(0, occupancy_reading)
+				motion_history.add(occupancy_reading)
 		except Exception, e:
 			print "Error Message:\n", str(e)
 			continue
 		time.sleep(MOTION_HISTORY_UPDATE_FREQUENCY)
 
 
-# Get occupancy score from the motion history queue.
-# Occupancy score is a discounted sum of motion values (which are 1 or 0).
-def get_occup_score(motion_values):
-	score = 0
-	alpha = DISCOUNT_FACTOR
-	for i, motion in enumerate(motion_values):
-		score += motion * alpha**i
-	return score	
+# Thread that updates motion history on PIR sensor's edge events (edge-triggered mode). Instead of reading the sensor
+# every MOTION_HISTORY_UPDATE_FREQUENCY seconds, it waits (with poll()) on the sysfs value file of the PIR pin, which
+# becomes readable whenever the pin's value changes.
+def update_motion_history_on_edges():
+	with open(GPIO_SYSFS_PATH.format(PIR_PIN) + 'edge', 'w') as f_edge:
+		f_edge.write('both')
+	f_value = open(GPIO_SYSFS_PATH.format(PIR_PIN) + 'value', 'r')
+	poller = select.poll()
+	poller.register(f_value, select.POLLPRI | select.POLLERR)
+	while True:
+		# The value has to be read after each event (this also acknowledges the event).
+		f_value.seek(0)
+		occupancy_reading = int(f_value.read().strip())
+		with lock:
+			motion_history.update_level(occupancy_reading, time.time())
+		# Wait for the next edge. On timeout, elapsed sample slots are added to the history anyway.
+		poller.poll(EDGE_WAIT_TIMEOUT * 1000)
 
 
 # Get occupancy status:
 #   1 - occupied
 #   0 - not occupied
-def get_occupancy_status():		
-	global motion_history
-	with lock:		
-		occup_score = get_occup_score(motion_history)
-		print "MOTION HISTORY: {}".format(motion_history)
+# Occupancy score (a discounted sum of motion values) is maintained by motion_history, so this takes O(1) time.
+def get_occupancy_status(verbose=True):
+	with lock:
+		if isinstance(motion_history, EdgeMotionHistory):
+			# Add sample slots that elapsed since the last edge event.
+			motion_history.catch_up(time.time())
+		occup_score = motion_history.score
+	if verbose:
 		print "\nOCCUPANCY SCORE: {}\n".format(occup_score)
+	return 1 if occup_score >= OCCUPANCY_SCORE_THRESHOLD else 0
+
 
-		if len(motion_history) >= MOTION_HISTORY_SIZE and occup_score >= 0.8:
-			return 1
-		elif len(motion_history) < MOTION_HISTORY_SIZE and occup_score >= 0.8:
-			return 1
+# Push (timestamp, light reading, occupancy reading) frames to the client at the given rate (frames per second), until
+# the client sends a request or closes the connection. Text frames are newline-delimited. Returns the received request.
+def push_sensor_readings(client, reader, rate, binary):
+	period = 1.0 / rate
+	next_push_time = time.time()
+	while True:
+		# Waiting on the socket (instead of sleeping) lets the client interrupt the stream at any moment.
+		if reader.pending():
+			return reader.read_request()
+		readable, _, _ = select.select([client], [], [], max(0.0, next_push_time - time.time()))
+		if readable:
+			return reader.read_request()
+		visible_light_reading = tsl.get_latest_value(TSL2561.Light.Visible)
+		occupancy_reading = get_occupancy_status(verbose=False)
+		if binary:
+			client.send(protocol.pack_reading(time.time(), visible_light_reading, occupancy_reading))
 		else:
-			return 0
+			client.send('{:.3f} {} {}\n'.format(time.time(), visible_light_reading, occupancy_reading))
+		next_push_time = max(next_push_time + period, time.time())
 
 
 # Start socket server to communicate with the control module (RPi).
@@ -103,41 +152,67 @@ def start_responder():
 	server.listen(1)
 	print "[*] Started listening on", ip, ":", port
 	client, addr = server.accept()
+	client.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
 	print "[*] Got a connection from", addr[0], ":", addr[1]
 
 	# Responder's logic:
+	# Receive a request from client (either a binary frame or a text message)
+	reader = protocol.MessageReader(client)
+	msg_type, payload, binary = reader.read_request()
 	while True:
-		# Receive data from client
-		data = client.recv(1024)
-		
-		print "\n[*] Received '", data, "' from the client"
-		if data == "Check connection":
-			client.send(str(machine_name) + " is Initialized")
+		print "\n[*] Received '", protocol.REQUEST_NAMES.get(msg_type, payload), "' from the client"
+		if msg_type == protocol.MSG_CHECK_CONNECTION:
+			reply = protocol.tag_protocol_version(str(machine_name) + " is Initialized")
+			client.send(protocol.pack_frame(protocol.MSG_TEXT, reply) if binary else reply)
 			print "    Processing done.\n[*] Reply sent"
-		elif data in ["disconnect", ""]:
-			client.send("Goodbye")
+		elif msg_type == protocol.MSG_DISCONNECT:
+			client.send(protocol.pack_frame(protocol.MSG_GOODBYE) if binary else "Goodbye")
 			print "[*] Client disconnected"
 			client.close()
 			server.close()
 			print "[*] Restarting the server"
 			start_responder()
 			break
-		elif data == "Read":
-			visible_light_reading = tsl.read_value(TSL2561.Light.Visible)
+		elif msg_type == protocol.MSG_READ:
+			visible_light_reading = tsl.get_latest_value(TSL2561.Light.Visible)
 			occupancy_reading = get_occupancy_status()
-			combined_string = '{} {}'.format(str(visible_light_reading), str(occupancy_reading))
-			client.send(combined_string)
+			if binary:
+				client.send(protocol.pack_reading(time.time(), visible_light_reading, occupancy_reading))
+			else:
+				combined_string = '{} {}'.format(str(visible_light_reading), str(occupancy_reading))
+				client.send(combined_string)
 			print "    Light:", visible_light_reading
 			print "    Occupancy:", occupancy_reading
 			print "[*] Sensor readings sent to the client"
+		elif msg_type == protocol.MSG_SUBSCRIBE:
+			rate = payload or DEFAULT_PUSH_RATE
+			print "[*] Client subscribed to sensor readings ({} frames per second)".format(rate)
+			# Streaming stops when the client sends the next request, which is then processed as usual.
+			msg_type, payload, binary = push_sensor_readings(client, reader, rate, binary)
+			print "[*] Streaming stopped"
+			continue
+
+		# Receive a request from client
+		msg_type, payload, binary = reader.read_request()
 
 
 if __name__ == '__main__':
-	tsl, pir = initialize_sensors()
-	motion_history = []
+	parser = argparse.ArgumentParser(description='Sensing module parameters')
+	parser.add_argument('-e', '--edge_triggered', action='store_true')
+	parser.add_argument('-w', '--light_window', type=int, default=1)
+	parser.add_argument('-s', '--slow_integration', action='store_true')
+	args = parser.parse_args()
+
+	tsl, pir = initialize_sensors(TSL2561.IntegrationTime.Slow if args.slow_integration else LIGHT_INTEGRATION_TIME)
+	tsl.start_sampling(LIGHT_SAMPLING_PERIOD, args.light_window)
+	if args.edge_triggered:
+		motion_history = EdgeMotionHistory(MOTION_HISTORY_SIZE, DISCOUNT_FACTOR, MOTION_HISTORY_UPDATE_FREQUENCY,
+		                                   time.time())
+	else:
+		motion_history = MotionHistory(MOTION_HISTORY_SIZE, DISCOUNT_FACTOR)
 	lock = threading.Lock()
 
-	thread = threading.Thread(target=update_motion_history)
+	thread = threading.Thread(target=update_motion_history_on_edges if args.edge_triggered else update_motion_history)
 	thread.daemon = True
 	thread.start()
 	start_responder()
@@ -6,10 +6,16 @@ Python Version: 2.7
 Portable sensing modules can connect to the smart lighting system when the main controller is running. They only have
 light sensors (it is assumed that when they are connected to the system, the area is occupied).
 
-This process sends (light sensor reading, user lux preference) to the control module (RPi), whenever RPi requests it.
+This process sends (light sensor reading, user lux preference) to the control module (RPi), whenever RPi requests it. If
+RPi subscribes to sensor readings ("Subscribe <rate>"), (timestamp, light sensor reading, user lux preference) frames are
+pushed to it at the requested rate, until RPi sends the next message.
+
+Both the binary protocol (see sensing_protocol.py) and the legacy text protocol are supported.
 
 A user can input user lux preference on the portable sensing module's light sensor.
 
+Light sensor is sampled by a background thread, and requests are answered with the latest sample.
+
 Note:
  - IP address (and port number) of the control module should be specified in the CONTROL_MODULE_ADDRESS.
  - Each light sensor has its own calibration constant, which should be specified in CALIBRATION_CONST.
@@ -19,8 +25,11 @@ on the sensor could be inferred at the control module based on the provided user
 For portable sensing modules, occupancy reading would always be 1.
 """
 
+import time
 import socket
+import select
 from tsl2561 import TSL2561
+import sensing_protocol as protocol
 from threading import Thread
 from threading import Lock
 
@@ -29,32 +38,73 @@ CALIBRATION_CONST = 0.449729180772
 # CONTROL_MODULE_ADDRESS = ('192.168.50.151', 1234)  # Macbook
 CONTROL_MODULE_ADDRESS = ('192.168.0.2', 1234)  # RPi
 DEFAULT_USER_LUX_PREFERENCE = 200
+DEFAULT_PUSH_RATE = 10  # frames per second pushed to a subscribed control module (if the rate is not specified)
+LIGHT_SAMPLING_PERIOD = 0.1  # seconds
+LIGHT_SAMPLING_WINDOW = 1  # number of light samples that are averaged
+# Light sensor integration time: readings change every ~0.1 s, so that the control module can detect when illuminance
+# settles after dimming (see RPi/settle_detection.py).
+LIGHT_INTEGRATION_TIME = TSL2561.IntegrationTime.Medium
+
+
+# Push (timestamp, light sensor reading, user lux preference) frames to the control module at the given rate (frames per
+# second), until it sends a request or closes the connection. Text frames are newline-delimited. Returns the received
+# request.
+def push_sensor_readings(client, reader, rate, binary):
+	period = 1.0 / rate
+	next_push_time = time.time()
+	while True:
+		if reader.pending():
+			return reader.read_request()
+		readable, _, _ = select.select([client], [], [], max(0.0, next_push_time - time.time()))
+		if readable:
+			return reader.read_request()
+		visible_light_reading = tsl.get_latest_value(TSL2561.Light.Visible)
+		with lock:
+			if binary:
+				frame = protocol.pack_reading(time.time(), visible_light_reading, user_lux_preference)
+			else:
+				frame = '{:.3f} {} {}\n'.format(time.time(), visible_light_reading, user_lux_preference)
+		client.send(frame)
+		next_push_time = max(next_push_time + period, time.time())
 
 
 # Start a socket server to communicate with the control module (RPi).
 def start_responder():
 	global user_lux_preference
 	client = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+	client.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
 	client.connect(CONTROL_MODULE_ADDRESS)
 
-	# When connection is established, send light calibration constant to the control module:
-	client.send(str(CALIBRATION_CONST))
+	# When connection is established, send light calibration constant (and supported protocol version) to the control
+	# module:
+	client.send('{} {}'.format(CALIBRATION_CONST, protocol.PROTOCOL_VERSION))
+	reader = protocol.MessageReader(client)
+	msg_type, payload, binary = reader.read_request()
 	while True:
-		data = client.recv(1024)
-		if data in ["disconnect", ""]:
-			client.send("Goodbye")
+		if msg_type == protocol.MSG_DISCONNECT:
+			client.send(protocol.pack_frame(protocol.MSG_GOODBYE) if binary else "Goodbye")
 			print "\n[*] Portable module disconnected"
 			client.close()
 			break
-		elif data == "Read":
-			visible_light_reading = tsl.read_value(TSL2561.Light.Visible)
+		elif msg_type == protocol.MSG_READ:
+			visible_light_reading = tsl.get_latest_value(TSL2561.Light.Visible)
 			with lock:
-				combined_string = '{} {}'.format(str(visible_light_reading), str(user_lux_preference))
-			client.send(combined_string)
+				if binary:
+					reply = protocol.pack_reading(time.time(), visible_light_reading, user_lux_preference)
+				else:
+					reply = '{} {}'.format(str(visible_light_reading), str(user_lux_preference))
+			client.send(reply)
+		elif msg_type == protocol.MSG_SUBSCRIBE:
+			rate = payload or DEFAULT_PUSH_RATE
+			# Streaming stops when the control module sends the next request, which is then processed as usual.
+			msg_type, payload, binary = push_sensor_readings(client, reader, rate, binary)
+			continue
+		msg_type, payload, binary = reader.read_request()
 
 
 if __name__ == '__main__':
-	tsl = TSL2561()
+	tsl = TSL2561(LIGHT_INTEGRATION_TIME)
+	tsl.start_sampling(LIGHT_SAMPLING_PERIOD, LIGHT_SAMPLING_WINDOW)
 	lock = Lock()
 	user_lux_preference = DEFAULT_USER_LUX_PREFERENCE
 
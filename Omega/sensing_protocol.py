@@ -0,0 +1,129 @@
+"""
+File name: sensing_protocol.py
+Author: Yerbol Aussat
+Python Version: 2.7
+
+Binary wire protocol for communication between sensing modules (Omega) and the control module (RPi).
+
+Note: the same file is used by sensing modules and by the control module, so RPi/sensing_protocol.py and
+Omega/sensing_protocol.py should be kept identical.
+
+Every message is a frame: a fixed-size header (protocol version, message type, payload length) followed by the payload.
+Sensor readings are sent as fixed-size records: (timestamp, light reading, occupancy reading or user lux preference).
+Since messages are length-prefixed, a frame split across several TCP segments is reassembled correctly, and several
+requests can be sent without waiting for replies (pipelining).
+
+Sensing modules keep supporting the legacy text protocol ("Read" -> "123 1", etc.). A binary frame is distinguished from
+a text message by its first byte (the protocol version, which is not a printable character). A sensing module reports
+the protocol version it supports in its reply to "Check connection" (see tag_protocol_version), and the control module
+switches to the binary protocol only if it supports the same version.
+"""
+
+import re
+import struct
+
+PROTOCOL_VERSION = 1
+
+# Message types
+MSG_CHECK_CONNECTION = 1  # Request. Reply: MSG_TEXT.
+MSG_READ = 2  # Request. Reply: MSG_READING.
+MSG_SUBSCRIBE = 3  # Request (payload: RATE_RECORD). Reply: MSG_READING frames pushed at the requested rate.
+MSG_DISCONNECT = 4  # Request. Reply: MSG_GOODBYE.
+MSG_GOODBYE = 5
+MSG_READING = 6  # Payload: READING_RECORD.
+MSG_TEXT = 7  # Payload: text.
+
+HEADER = struct.Struct('!BBH')  # protocol version, message type, payload length
+READING_RECORD = struct.Struct('!dii')  # timestamp, light reading, occupancy reading (or user lux preference)
+RATE_RECORD = struct.Struct('!f')  # frames per second
+
+# Legacy text requests and corresponding message types.
+TEXT_REQUESTS = {"Check connection": MSG_CHECK_CONNECTION, "Read": MSG_READ, "disconnect": MSG_DISCONNECT}
+REQUEST_NAMES = {MSG_CHECK_CONNECTION: "Check connection", MSG_READ: "Read", MSG_SUBSCRIBE: "Subscribe",
+                 MSG_DISCONNECT: "disconnect"}
+PROTOCOL_TAG_PATTERN = re.compile(r'\[protocol (\d+)\]$')
+
+
+# Pack a message into a frame.
+def pack_frame(msg_type, payload=''):
+	return HEADER.pack(PROTOCOL_VERSION, msg_type, len(payload)) + payload
+
+
+# Pack sensor readings into a MSG_READING frame.
+def pack_reading(timestamp, light_reading, second_reading):
+	return pack_frame(MSG_READING, READING_RECORD.pack(timestamp, light_reading, second_reading))
+
+
+# Add the supported protocol version to a reply to "Check connection".
+def tag_protocol_version(text):
+	return '{} [protocol {}]'.format(text, PROTOCOL_VERSION)
+
+
+# Get the protocol version reported in a reply to "Check connection" (None if it's not reported, i.e., only the legacy
+# text protocol is supported).
+def get_protocol_version(text):
+	match = PROTOCOL_TAG_PATTERN.search(text)
+	return int(match.group(1)) if match else None
+
+
+# MessageReader receives messages from a socket. Received data is buffered, so that frames that arrive in several
+# segments (or several frames that arrive in one segment) are handled correctly.
+class MessageReader:
+	def __init__(self, sock):
+		self.sock = sock
+		self.buffer = ''
+
+	# Receive more data from the socket. Returns False if the connection is closed.
+	def __fill(self):
+		data = self.sock.recv(4096)
+		self.buffer += data
+		return len(data) > 0
+
+	# Check if there is received data that hasn't been read yet.
+	def pending(self):
+		return len(self.buffer) > 0
+
+	# Read a frame: (message type, payload). Returns None if the connection is closed.
+	def read_frame(self):
+		while len(self.buffer) < HEADER.size:
+			if not self.__fill():
+				return None
+		version, msg_type, length = HEADER.unpack_from(self.buffer)
+		if version != PROTOCOL_VERSION:
+			raise ValueError('Protocol version {} is not supported!'.format(version))
+		while len(self.buffer) < HEADER.size + length:
+			if not self.__fill():
+				return None
+		payload = self.buffer[HEADER.size:HEADER.size + length]
+		self.buffer = self.buffer[HEADER.size + length:]
+		return msg_type, payload
+
+	# Read a newline-delimited text line (legacy text protocol in push mode). Returns None if the connection is closed.
+	def read_line(self):
+		while '\n' not in self.buffer:
+			if not self.__fill():
+				return None
+		line, self.buffer = self.buffer.split('\n', 1)
+		return line
+
+	# Read a request (sensing module's side), which can be either a binary frame or a legacy text message.
+	# Returns (message type, payload, binary). For MSG_SUBSCRIBE, payload is the requested rate (None if it's not
+	# specified). For unknown text messages, message type is None and payload is the message.
+	def read_request(self):
+		if not self.buffer and not self.__fill():
+			return MSG_DISCONNECT, None, False
+		if self.buffer[0] == chr(PROTOCOL_VERSION):
+			frame = self.read_frame()
+			if frame is None:
+				return MSG_DISCONNECT, None, True
+			msg_type, payload = frame
+			if msg_type == MSG_SUBSCRIBE:
+				payload = RATE_RECORD.unpack(payload)[0]
+			return msg_type, payload, True
+
+		# Legacy text protocol: a message is whatever has been received.
+		text, self.buffer = self.buffer, ''
+		if text.startswith("Subscribe"):
+			values = text.split()
+			return MSG_SUBSCRIBE, float(values[1]) if len(values) > 1 else None, False
+		return TEXT_REQUESTS.get(text), text, False
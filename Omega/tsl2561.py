@@ -4,12 +4,22 @@ Author: Yerbol Aussat
 Python Version: 2.7
 
 This class abstracts away low-level details of interaction with a TSL-2561 light sensor.
+
+The sensor can either be read on demand (read_value), or sampled by a background thread (start_sampling), in which case
+the latest reading is served from memory (get_latest_value), without any I2C transactions on the caller's side.
+
+Integration time and gain are configurable (shorter integration time gives fresh samples more often, at lower
+resolution). Readings are scaled to the default settings (402 ms, 1x gain), so that light calibration constants stay
+valid for all settings.
 """
 
 from OmegaExpansion import onionI2C
 import time
 import traceback
 from enum import Enum
+from collections import deque
+from threading import Thread
+from threading import Lock
 
 
 class TSL2561:
@@ -18,32 +28,130 @@ class TSL2561:
 		Infrared = 1
 		Visible = 2
 
-	def __init__(self):
+	# Values of INTEG field of the timing register.
+	class IntegrationTime(Enum):
+		Fast = 0x00  # 13.7 ms
+		Medium = 0x01  # 101 ms
+		Slow = 0x02  # 402 ms
+
+	# Values of GAIN field of the timing register.
+	class Gain(Enum):
+		Low = 0x00  # 1x
+		High = 0x10  # 16x
+
+	# Integration time (in seconds), and scale factor that converts readings to the 402 ms integration time (see the
+	# TSL2561 datasheet).
+	INTEGRATION_SECONDS = {IntegrationTime.Fast: 0.0137, IntegrationTime.Medium: 0.101, IntegrationTime.Slow: 0.402}
+	INTEGRATION_SCALE = {IntegrationTime.Fast: 322.0 / 11, IntegrationTime.Medium: 322.0 / 81, IntegrationTime.Slow: 1}
+	GAIN_SCALE = {Gain.Low: 1, Gain.High: 1.0 / 16}
+
+	DEFAULT_SAMPLING_PERIOD = 0.1  # seconds
+
+	# @param burst: if True, both channels are read in one 4-byte I2C transaction (otherwise, in two transactions).
+	def __init__(self, integration_time=IntegrationTime.Slow, gain=Gain.Low, burst=True):
 		self.i2c = onionI2C.OnionI2C()
 		self.i2c.writeByte(0x39, 0x00 | 0x80, 0x03)
-		self.i2c.writeByte(0x39, 0x01 | 0x80, 0x02)
+		self.set_timing(integration_time, gain)
 		time.sleep(0.5) # not sure if this is necessary?
 		self.previous_value = 0
+		self.burst = burst
 
-	def read_value(self, light_type):
-		try:
+		# Background sampling: the latest (ch0, ch1, timestamp) sample, averaged over the sampling window.
+		self.latest_sample = None
+		self.samples = None
+		self.sampling_lock = Lock()
+
+	# Set integration time and gain (timing register). Note that a sample with new settings is available only after
+	# the integration time passes.
+	def set_timing(self, integration_time, gain):
+		self.i2c.writeByte(0x39, 0x01 | 0x80, gain.value | integration_time.value)
+		self.integration_time = integration_time
+		self.gain = gain
+		self.scale = TSL2561.INTEGRATION_SCALE[integration_time] * TSL2561.GAIN_SCALE[gain]
+
+	# Get integration time in seconds.
+	def get_integration_seconds(self):
+		return TSL2561.INTEGRATION_SECONDS[self.integration_time]
+
+	# Read raw values of both channels: (ch0, ch1). Channel 0 is full spectrum, channel 1 is infrared.
+	def read_raw_channels(self):
+		if self.burst:
+			# Data registers of both channels (0x0C - 0x0F) are contiguous, so they are read in one block. This also
+			# guarantees that both values come from the same integration cycle.
+			data = self.i2c.readBytes(0x39, 0x0C | 0x80, 4)
+			data1 = data[2:]
+		else:
 			data = self.i2c.readBytes(0x39, 0x0C | 0x80, 2)
 			data1 = self.i2c.readBytes(0x39, 0x0E | 0x80, 2)
-			ch0 = data[1] * 256 + data[0]
-			ch1 = data1[1] * 256 + data1[0]
-			if light_type == TSL2561.Light.Full_Spectrum:
-				self.previous_value = ch0
-				return ch0
-			elif light_type == TSL2561.Light.Infrared:
-				self.previous_value = ch1
-				return ch1
-			elif light_type == TSL2561.Light.Visible:
-				self.previous_value = ch0 - ch1
-				return ch0 - ch1
-			raise ValueError('Light Type {} is not supported!'.format(light_type))
+		ch0 = data[1] * 256 + data[0]
+		ch1 = data1[1] * 256 + data1[0]
+		return ch0, ch1
+
+	# Read values of both channels, scaled to the default integration time and gain: (ch0, ch1).
+	def read_channels(self):
+		ch0, ch1 = self.read_raw_channels()
+		if self.scale == 1:
+			return ch0, ch1
+		return int(round(ch0 * self.scale)), int(round(ch1 * self.scale))
+
+	# Get light value of the given type from raw values of both channels.
+	@staticmethod
+	def get_light(ch0, ch1, light_type):
+		if light_type == TSL2561.Light.Full_Spectrum:
+			return ch0
+		elif light_type == TSL2561.Light.Infrared:
+			return ch1
+		elif light_type == TSL2561.Light.Visible:
+			return ch0 - ch1
+		raise ValueError('Light Type {} is not supported!'.format(light_type))
+
+	def read_value(self, light_type):
+		try:
+			ch0, ch1 = self.read_channels()
+			self.previous_value = TSL2561.get_light(ch0, ch1, light_type)
+			return self.previous_value
 		
 		# If error occurred (such as I2C transaction error), return previous light value
 		except Exception, e:
 			print "Error Message:\n", str(e)
 			# traceback.print_exc() 
 			return self.previous_value
+
+	# Start a thread that samples the light sensor every period seconds, and keeps the latest sample. If window > 1, the
+	# latest sample is a moving average of the last window samples.
+	def start_sampling(self, period=DEFAULT_SAMPLING_PERIOD, window=1):
+		self.samples = deque(maxlen=window)
+		thread = Thread(target=self.__sample, args=(period, ))
+		thread.daemon = True
+		thread.start()
+
+	# Thread that keeps sampling the light sensor.
+	def __sample(self, period):
+		while True:
+			try:
+				ch0, ch1 = self.read_channels()
+			# If error occurred (such as I2C transaction error), the previous sample is kept.
+			except Exception, e:
+				print "Error Message:\n", str(e)
+			else:
+				self.samples.append((ch0, ch1))
+				n_samples = len(self.samples)
+				avg_ch0 = float(sum(sample[0] for sample in self.samples)) / n_samples
+				avg_ch1 = float(sum(sample[1] for sample in self.samples)) / n_samples
+				with self.sampling_lock:
+					self.latest_sample = (avg_ch0, avg_ch1, time.time())
+			time.sleep(period)
+
+	# Get the latest (ch0, ch1, timestamp) sample taken by the sampling thread (None if there are no samples yet).
+	def get_latest_sample(self):
+		with self.sampling_lock:
+			return self.latest_sample
+
+	# Get the latest light value of the given type. If the sampling thread is not running (or hasn't taken any samples
+	# yet), the sensor is read right away.
+	def get_latest_value(self, light_type):
+		sample = self.get_latest_sample()
+		if sample is None:
+			return self.read_value(light_type)
+		ch0, ch1, _ = sample
+		return int(round(TSL2561.get_light(ch0, ch1, light_type)))
@@ -4,14 +4,210 @@ Author: Yerbol Aussat
 Python Version: 2.7
 
 CeilingActuatuion class abstacts away actuation of LED bulbs.
+
+Current dimming levels of bulbs are kept in memory (protected by the lock of CeilingActuation), and are shared with
+other processes through the state bus (see state_bus.py), if it is provided. If dimming levels in the state bus were
+changed by another process (e.g., by calibration in the rpi_sense process), they replace the in-memory ones. Snapshots
+of dimming levels can also be saved to DIM_LEVEL_FILE_NAME file (by default, only if there is no state bus): they are
+written by a background thread to a temporary file, which is then renamed, so readers never see a half-written file.
+
+Bulbs are only written to when their state changes: if the brightness control value of a bulb (0-255) would differ from
+the last one that was set on it by at most brightness_deadband (0 - only identical values are skipped), or the bulb
+stays off, no request is sent to the bridge. Otherwise, on/off state and brightness of the bulb are set with one
+request, which only contains the fields that changed (see phue.Light.set_state).
+
+All requests to bulbs go through ActuationScheduler, which keeps at most one pending state per bulb (a new state of a
+bulb replaces its pending one, and requests of both are answered by the request for the new state), and paces requests
+with a token bucket, since the Hue bridge throttles at about 10 light commands per second. Requests are sent
+concurrently by a pool of worker threads owned by CeilingActuation (at most one request per bulb at a time).
+set_dimming_async returns per-bulb futures, so that callers can do other work while bulbs are being set, and get errors
+of individual bulbs.
+
+CeilingActuation owns threads (the worker pool, the dispatcher of the scheduler, and the snapshot thread) and
+connections to the bridge, so close() should be called when an instance is no longer used.
 """
 
 import time
+import os
+import numpy as np
+from collections import OrderedDict, deque
 from phue import Bridge
+from dimming_conversion import DimmingConversion
 from pandas import DataFrame
 from datetime import datetime as dt
-from threading import Thread
-from threading import Lock
+from threading import Lock, Condition, Event, Thread
+from multiprocessing import TimeoutError
+from multiprocessing.pool import ThreadPool
+
+
+# Future of a bulb state request. Its interface is the same as of multiprocessing.pool.AsyncResult.
+class ActuationRequest:
+	def __init__(self, callback=None):
+		self.submit_time = time.time()
+		self.callback = callback  # Called with the request when it's completed (before it's ready).
+		self.event = Event()
+		self.value = None
+		self.error = None
+
+	# Complete the request with the value (or the error) of the request that was sent to the bulb.
+	def complete(self, value, error=None):
+		self.value = value
+		self.error = error
+		try:
+			if self.callback:
+				self.callback(self)
+		finally:
+			self.event.set()
+
+	def ready(self):
+		return self.event.is_set()
+
+	def successful(self):
+		if not self.ready():
+			raise ValueError("Request is not ready")
+		return self.error is None
+
+	def wait(self, timeout=None):
+		self.event.wait(timeout)
+
+	# Get value of the request; raises the error of the request if it failed.
+	def get(self, timeout=None):
+		self.wait(timeout)
+		if not self.ready():
+			raise TimeoutError
+		if self.error is not None:
+			raise self.error
+		return self.value
+
+
+# Scheduler of bulb state requests: keeps the latest pending state of every bulb, and sends them (by calling
+# send_fn(bulb index, state) in the worker pool) at most request_rate times per second on average, with bursts of up to
+# request_burst requests (request_rate None - no limit).
+class ActuationScheduler:
+	# Number of the latest requests that latency metrics are computed over.
+	LATENCY_WINDOW = 100
+
+	def __init__(self, send_fn, pool, request_rate, request_burst):
+		self.send_fn = send_fn
+		self.pool = pool
+		self.request_rate = request_rate
+		self.request_burst = request_burst
+		self.condition = Condition()
+		self.pending = OrderedDict()  # Bulb index -> (state, requests), from the oldest to the newest bulb.
+		self.in_flight = set()  # Bulbs whose requests are being sent.
+		self.tokens = float(request_burst)
+		self.last_refill = time.time()
+		self.closed = False
+		# Metrics
+		self.n_submitted = 0
+		self.n_coalesced = 0  # Pending states that were replaced by newer ones before they were sent.
+		self.n_sent = 0
+		self.latencies = deque(maxlen=self.LATENCY_WINDOW)  # From submission to completion of a request (s).
+		self.queue_waits = deque(maxlen=self.LATENCY_WINDOW)  # From submission to sending of a state (s).
+
+		self.dispatcher = Thread(target=self.__dispatch)
+		self.dispatcher.daemon = True
+		self.dispatcher.start()
+
+	# Submit state of a bulb i. Returns ActuationRequest, whose value is the value returned by send_fn.
+	# Raises IOError if the scheduler is closed.
+	def submit(self, i, state, callback=None):
+		request = ActuationRequest(callback)
+		with self.condition:
+			if self.closed:
+				raise IOError("Actuation scheduler is closed")
+			self.n_submitted += 1
+			if i in self.pending:
+				self.n_coalesced += 1
+				self.pending[i] = (state, self.pending[i][1] + [request])  # The bulb keeps its place in the queue.
+			else:
+				self.pending[i] = (state, [request])
+			self.condition.notify()
+		return request
+
+	# Stop the dispatcher thread. Pending states are not sent (their requests fail with IOError); requests in flight are
+	# completed by the worker pool.
+	def close(self):
+		with self.condition:
+			self.closed = True
+			pending = self.pending
+			self.pending = OrderedDict()
+			self.condition.notify()
+		for _, requests in pending.values():
+			for request in requests:
+				request.complete(None, IOError("Actuation scheduler is closed"))
+		self.dispatcher.join()
+
+	# Check that a bulb i has neither pending nor in-flight requests.
+	def is_idle(self, i):
+		with self.condition:
+			return i not in self.pending and i not in self.in_flight
+
+	# Get actuation metrics: number of pending and in-flight requests, request counts, and mean and max latency and
+	# queue wait time (s) of the latest requests.
+	def get_metrics(self):
+		with self.condition:
+			latencies = list(self.latencies)
+			queue_waits = list(self.queue_waits)
+			return {
+				"queue_depth": len(self.pending),
+				"in_flight": len(self.in_flight),
+				"n_submitted": self.n_submitted,
+				"n_coalesced": self.n_coalesced,
+				"n_sent": self.n_sent,
+				"mean_latency": sum(latencies) / len(latencies) if latencies else 0.0,
+				"max_latency": max(latencies) if latencies else 0.0,
+				"mean_queue_wait": sum(queue_waits) / len(queue_waits) if queue_waits else 0.0,
+				"max_queue_wait": max(queue_waits) if queue_waits else 0.0,
+			}
+
+	# Get time to wait for a token (0 if a token is available, in which case it's taken).
+	def __take_token(self):
+		if self.request_rate is None:
+			return 0
+		now = time.time()
+		self.tokens = min(self.request_burst, self.tokens + (now - self.last_refill) * self.request_rate)
+		self.last_refill = now
+		if self.tokens >= 1:
+			self.tokens -= 1
+			return 0
+		return (1 - self.tokens) / self.request_rate
+
+	# Dispatcher thread: sends pending states of bulbs (the oldest first) that don't have requests in flight.
+	def __dispatch(self):
+		while True:
+			with self.condition:
+				if self.closed:
+					return
+				i = next((i for i in self.pending if i not in self.in_flight), None)
+				if i is None:
+					self.condition.wait()
+					continue
+				token_wait_time = self.__take_token()
+				if token_wait_time > 0:
+					self.condition.wait(token_wait_time)
+					continue
+				state, requests = self.pending.pop(i)
+				self.in_flight.add(i)
+				self.n_sent += 1
+				now = time.time()
+				self.queue_waits.extend(now - request.submit_time for request in requests)
+			self.pool.apply_async(self.__send, (i, state, requests))
+
+	# Send state of a bulb i (task of the worker pool), and complete its requests.
+	def __send(self, i, state, requests):
+		value, error = None, None
+		try:
+			value = self.send_fn(i, state)
+		except Exception, e:
+			error = e
+		with self.condition:
+			self.in_flight.discard(i)
+			now = time.time()
+			self.latencies.extend(now - request.submit_time for request in requests)
+			self.condition.notify()
+		for request in requests:
+			request.complete(value, error)
 
 
 class CeilingActuation:
@@ -21,117 +217,259 @@ class CeilingActuation:
 	BULB_DICT = {0: (0, 0), 1: (0, 2), 2: (2, 0), 3: (2, 2), 4: (0, 1), 5: (2, 1), 6: (1, 2), 7: (1, 0)}
 	DIM_LEVEL_FILE_NAME = 'cur_dim_level.txt'
 
-	# [Dimming level -> brightness control value] conversion constants (obtained empirically).
+	# [Dimming level -> brightness control value] conversion constants (obtained empirically, see dimming_conversion.py).
 	A_DIM = 2.6414778091586396e-05
 	M_DIM = 1.89507782939784
 	B_DIM = 0.04746252810564729
 
-	def __init__(self, phue_bridge_ip_address):
-		bridge = Bridge(phue_bridge_ip_address)
-		bridge.connect()
-		self.lights = bridge.lights
+	# Bulbs whose brightness control value would change by at most this value are not written to.
+	BRIGHTNESS_DEADBAND = 0
+	# Duration of transitions to new dimming levels, in deciseconds (None - default duration of the bulbs).
+	TRANSITION_TIME = None
+	# Budget of requests to the bridge: average number of requests per second, and max number of requests in a burst.
+	REQUEST_RATE = 10.0
+	REQUEST_BURST = 8
+
+	def __init__(self, phue_bridge_ip_address, state_bus=None, brightness_deadband=BRIGHTNESS_DEADBAND,
+	             request_rate=REQUEST_RATE, request_burst=REQUEST_BURST, snapshot_dim_levels=None):
+		self.bridge = Bridge(phue_bridge_ip_address)
+		self.bridge.connect()
+		self.lights = self.bridge.lights
 		print "[*] Successfully connected to Philips Hue Bridge"
 		self.lock = Lock()
+		self.closed = False
+		self.state_bus = state_bus
+		self.dim_conversion = DimmingConversion(self.A_DIM, self.M_DIM, self.B_DIM)
+		self.brightness_deadband = brightness_deadband
+		# Last state set on each bulb: (dimming level, on, brightness control value); None if it's unknown.
+		self.bulb_states = [None for _ in range(len(self.lights))]
+		# Worker threads that send requests to bulbs.
+		self.actuation_pool = ThreadPool(len(self.lights))
+		self.scheduler = ActuationScheduler(self.__set_bulb_state, self.actuation_pool, request_rate, request_burst)
 
-	# Convert dimming level to control value.
-	def __dim_to_contr(self, d):
-		if d == -1:
-			return -1
-		elif d <= self.B_DIM:
-			return 0
-		elif d > 1:
-			return 255
-		control_val = ((d-self.B_DIM) / self.A_DIM) ** (1.0 / self.M_DIM)
-		return control_val
-	
-	# Set dimming level dim_val on a bulb i.
+		# Current dimming levels (None if they are unknown), and their last snapshot in the state bus.
+		self.dim_levels = None
+		self.bus_dim_levels = None
+		if state_bus:
+			self.__sync_dim_levels()
+		elif os.path.isfile(self.DIM_LEVEL_FILE_NAME):
+			with open(self.DIM_LEVEL_FILE_NAME, 'r') as f_dim:
+				self.dim_levels = np.array([float(val) for val in f_dim.read().split()])
+		if snapshot_dim_levels is None:
+			snapshot_dim_levels = state_bus is None
+		self.snapshot_event = None  # Set when dimming levels change (if snapshots are saved), or when closing.
+		self.snapshot_thread = None
+		if snapshot_dim_levels:
+			self.snapshot_event = Event()
+			self.snapshot_thread = Thread(target=self.__save_snapshots)
+			self.snapshot_thread.daemon = True
+			self.snapshot_thread.start()
+
+	# Release threads and connections: stop the scheduler, wait for requests in flight, save the last snapshot of
+	# dimming levels, and close connections to the bridge. Bulbs can't be set after that.
+	def close(self):
+		with self.lock:
+			if self.closed:
+				return
+			self.closed = True
+		self.scheduler.close()
+		self.actuation_pool.close()
+		self.actuation_pool.join()
+		if self.snapshot_thread:
+			self.snapshot_event.set()
+			self.snapshot_thread.join()
+		self.bridge.close_connections()
+
+	# Update in-memory dimming levels with the ones in the state bus, if they were changed by another process (then bulb
+	# states are unknown, also to the phue lights). Should be called with the lock held.
+	def __sync_dim_levels(self):
+		bus_dim_levels = self.state_bus.get_dim_levels()
+		if bus_dim_levels is None:
+			return
+		bus_dim_levels = np.array(bus_dim_levels)
+		if self.bus_dim_levels is not None and np.array_equal(bus_dim_levels, self.bus_dim_levels):
+			return
+		self.bulb_states = [None for _ in range(len(self.lights))]
+		for light in self.lights:
+			light.forget_state()
+		self.dim_levels = bus_dim_levels
+		self.bus_dim_levels = bus_dim_levels.copy()
+
+	# Store current dimming levels (in memory, and in the state bus), and request a snapshot.
+	def __save_dim_levels(self, dim_levels):
+		with self.lock:
+			self.dim_levels = np.array(dim_levels, dtype=float)
+			if self.state_bus:
+				self.state_bus.set_dim_levels(self.dim_levels)
+				self.bus_dim_levels = self.dim_levels.copy()
+		if self.snapshot_event:
+			self.snapshot_event.set()
+
+	# Load current dimming levels. Raises IOError if dimming levels are not available.
+	def __load_dim_levels(self):
+		with self.lock:
+			if self.state_bus:
+				self.__sync_dim_levels()
+			if self.dim_levels is None:
+				raise IOError("Dimming levels are not set")
+			return self.dim_levels.tolist()
+
+	# Snapshot thread: saves dimming levels to the dimming levels file when they change (only the latest ones are saved).
+	# Returns when CeilingActuation is closed.
+	def __save_snapshots(self):
+		tmp_file_name = self.DIM_LEVEL_FILE_NAME + '.tmp'
+		while True:
+			self.snapshot_event.wait()
+			self.snapshot_event.clear()
+			with self.lock:
+				closed = self.closed
+				dim_levels = self.dim_levels
+			if dim_levels is not None:
+				try:
+					with open(tmp_file_name, 'w') as f_dim:
+						f_dim.write(' '.join([str(val) for val in dim_levels]))
+					os.rename(tmp_file_name, self.DIM_LEVEL_FILE_NAME)
+				except (IOError, OSError), e:
+					print "Couldn't save dimming levels: {}".format(e)
+			if closed:
+				return
+
+	# Get bulb states for dimming levels dim_vals: list of (dimming level, on, brightness control value), where the
+	# dimming level is the one that is realized by the (integer) brightness control value.
 	# (Note that when dim_val <= 0.05, we turn off the bulb. The reason is that our bulbs (Philips Hue PAR-38) are
 	# physically unable to achieve dimming levels in the interval (0; 0.5], i.e., the lowest achievable dimming level when
 	# a bulb is on is ~0.05.)
-	def set_bulb(self, i, dim_val, dim_levels):
-		try:
-			if dim_val <= 0.05:
-				with self.lock:
-					dim_levels[i] = 0.0
-				self.lights[i].on = False
-			elif dim_val > 1:
-				with self.lock:
-					dim_levels[i] = 1.0
-				self.lights[i].on = True
-				self.lights[i].brightness = int(round(self.__dim_to_contr(1)))
-			else:
-				with self.lock:
-					dim_levels[i] = dim_val
-				self.lights[i].on = True
-				self.lights[i].brightness = int(round(self.__dim_to_contr(dim_val)))
-		except Exception, e:
-			print "\n ERROR: Bulb {}".format(i)
-			print str(e), '\n'
+	def __get_bulb_states(self, dim_vals, off_dim_level=0.05):
+		dim_vals = np.asarray(dim_vals, dtype=float).ravel()
+		codes = self.dim_conversion.get_codes(dim_vals)
+		realized_dim_levels = self.dim_conversion.get_dim_levels(codes)
+		return [(float(realized_dim_levels[i]), True, int(codes[i])) if dim_vals[i] > off_dim_level else (0.0, False, None)
+		        for i in range(len(dim_vals))]
+
+	# Check if setting bulb state new_state on a bulb i can be skipped (i.e., it's within the deadband of the bulb's
+	# current state).
+	def __is_in_deadband(self, i, new_state):
+		with self.lock:
+			cur_state = self.bulb_states[i]
+		if cur_state is None or cur_state[1] != new_state[1]:
+			return False
+		return not new_state[1] or abs(new_state[2] - cur_state[2]) <= self.brightness_deadband
 
-	# Set dimming levels on all bulbs cuncurrently (using multithreading).
-	def set_dimming(self, desired_dimming, wait_time=0.0):
+	# Set bulb state on a bulb i (called by the scheduler in the worker pool). Bulbs whose state is within the deadband
+	# are not written to. Returns the dimming level of the bulb.
+	def __set_bulb_state(self, i, bulb_state):
+		if self.__is_in_deadband(i, bulb_state):
+			with self.lock:
+				return self.bulb_states[i][0]
+		dim_level, on, brightness = bulb_state
+		with self.lock:
+			self.bulb_states[i] = None  # The state is unknown until the request succeeds.
+		self.lights[i].set_state(on=on, brightness=brightness, transitiontime=self.TRANSITION_TIME)
+		with self.lock:
+			self.bulb_states[i] = bulb_state
+		return dim_level
+
+	# Submit bulb state to the scheduler. If the bulb is idle and the state is within its deadband, the returned request
+	# is already completed, and no request is queued.
+	def __submit_bulb_state(self, i, bulb_state, callback=None):
+		if self.scheduler.is_idle(i) and self.__is_in_deadband(i, bulb_state):
+			request = ActuationRequest(callback)
+			with self.lock:
+				dim_level = self.bulb_states[i][0]
+			request.complete(dim_level)
+			return request
+		return self.scheduler.submit(i, bulb_state, callback)
+
+	# Start setting dimming levels on all bulbs, and return without waiting for them to be set.
+	# Returns a list of futures (ActuationRequest), one per bulb: future.get() returns the dimming level of the bulb, or
+	# raises the error that occurred while setting it (if the bulb's state was replaced by a newer one before it was sent,
+	# the future is answered by the newer one). Dimming levels are saved before the last future is ready.
+	def set_dimming_async(self, desired_dimming):
 		if len(desired_dimming) != 8:
 			raise ValueError('Error: Length of dimming vector should be 8!')
+		bulb_states = self.__get_bulb_states(desired_dimming)
+		dim_levels = [bulb_state[0] for bulb_state in bulb_states]
+		remaining = [len(desired_dimming)]
 
-		print "{:<35} {:<25}".format("Setting dimming values...", dt.now().strftime("%H:%M:%S.%f"))
+		# Store dimming level of a completed request, and save dimming levels when all requests are completed.
+		def on_complete(i, request):
+			with self.lock:
+				if request.error is None:
+					dim_levels[i] = request.value
+				remaining[0] -= 1
+				all_set = remaining[0] == 0
+			if all_set:
+				self.__save_dim_levels(dim_levels)
 
-		dim_levels = [None for _ in range(len(desired_dimming))]
-		thread_list = []
-		for i, dim_val in enumerate(desired_dimming):
-			thread = Thread(target=self.set_bulb, args=(i, dim_val, dim_levels))
-			thread_list.append(thread)
-			thread.start()
-		for thread in thread_list:
-			thread.join()
+		return [self.__submit_bulb_state(i, bulb_state, lambda request, i=i: on_complete(i, request))
+		        for i, bulb_state in enumerate(bulb_states)]
 
+	# Wait for bulbs to be dimmed: for wait_time seconds, or until illuminance settles (if settle_detector is given, see
+	# settle_detection.py), but at most for wait_time seconds.
+	def __wait_for_dimming(self, wait_time, settle_detector):
+		if settle_detector and wait_time > 0:
+			settle_detector.wait(wait_time)
+		else:
+			time.sleep(wait_time)
+
+	# Set dimming levels on all bulbs concurrently, and wait until they are set (and for bulbs to be dimmed, see
+	# __wait_for_dimming).
+	def set_dimming(self, desired_dimming, wait_time=0.0, settle_detector=None):
+		print "{:<35} {:<25}".format("Setting dimming values...", dt.now().strftime("%H:%M:%S.%f"))
+		for i, future in enumerate(self.set_dimming_async(desired_dimming)):
+			try:
+				future.get()
+			except Exception, e:
+				print "\n ERROR: Bulb {}".format(i)
+				print str(e), '\n'
 		print "{:<35} {:<25}".format("New dimming values set.", dt.now().strftime("%H:%M:%S.%f"))
-		# Update dimming levels file
-		dim_levels_str = ' '.join([str(val) for val in dim_levels])
-		with open(self.DIM_LEVEL_FILE_NAME, 'w+') as f_dim:
-			f_dim.write(dim_levels_str)
-		time.sleep(wait_time)
+		self.print_actuation_metrics()
+		self.__wait_for_dimming(wait_time, settle_detector)
 				
 	# Change dimming level on a bulb.
 	# @param bulb_id: id of bulb whose dimming needs to be changed
 	# @param delta_dim: value in [-1.0, 1.0] that corresponds to change in dimming
 	# @param wait_time is the amount of time the system waits for bulbs to be dimmed
-	def change_dim_on_bulb(self, bulb_id, delta_dim, wait_time=0):
+	# @param settle_detector: if given, the wait ends as soon as illuminance settles
+	def change_dim_on_bulb(self, bulb_id, delta_dim, wait_time=0, settle_detector=None):
 		try:		
-			# If cur_dim_level file already exists, read current dimming levels on bulbs
-			with open(self.DIM_LEVEL_FILE_NAME, 'r') as f_dim:
-				dim_levels_str = f_dim.read()
-			dim_levels = [float(val) for val in dim_levels_str.split()]
+			# If dimming levels are already set, read current dimming levels on bulbs
+			dim_levels = self.__load_dim_levels()
 			cur_dim = dim_levels[bulb_id]
 			target_dim = cur_dim + delta_dim
 			print " * Target dimming on bulb {} is set to {}.".format(bulb_id, target_dim)
-			if target_dim <= 0.01:
-				target_dim = 0.0
-				self.lights[bulb_id].on = False
-			elif target_dim > 1:
+			with self.lock:
+				self.bulb_states[bulb_id] = None  # The state is unknown until the requests succeed.
+			if target_dim > 1:
 				print "Target dimming on bulb {} is out of range.".format(bulb_id)
-				self.lights[bulb_id].on = True
-				self.lights[bulb_id].brightness = int(round(self.__dim_to_contr(1)))
-				target_dim = 1.0
-			else:
-				self.lights[bulb_id].on = True
-				self.lights[bulb_id].brightness = int(round(self.__dim_to_contr(target_dim)))
+			bulb_state = self.__get_bulb_states([target_dim], off_dim_level=0.01)[0]
+			self.__submit_bulb_state(bulb_id, bulb_state).get()
 	
-			# Write updated dimming level values to a file
-			dim_levels[bulb_id] = target_dim
-			dim_levels_str = ' '.join([str(val) for val in dim_levels])
-			with open(self.DIM_LEVEL_FILE_NAME, 'w+') as f_dim:
-				f_dim.write(dim_levels_str)
-			time.sleep(wait_time)
+			# Store updated dimming level values
+			dim_levels[bulb_id] = bulb_state[0]
+			self.__save_dim_levels(dim_levels)
+			self.__wait_for_dimming(wait_time, settle_detector)
 		except IOError:
-			print "Dimming levels file is not found"
+			print "Dimming levels are not found"
+
+	# Get actuation metrics (see ActuationScheduler.get_metrics).
+	def get_actuation_metrics(self):
+		return self.scheduler.get_metrics()
+
+	# Print actuation metrics.
+	def print_actuation_metrics(self):
+		metrics = self.get_actuation_metrics()
+		print "{:<35} depth {}, in flight {}, {} sent, {} coalesced".format(
+			"Actuation queue:", metrics["queue_depth"], metrics["in_flight"], metrics["n_sent"], metrics["n_coalesced"])
+		print "{:<35} mean {:.1f} ms, max {:.1f} ms (queue wait: mean {:.1f} ms, max {:.1f} ms)".format(
+			"Actuation latency:", metrics["mean_latency"] * 1000, metrics["max_latency"] * 1000,
+			metrics["mean_queue_wait"] * 1000, metrics["max_queue_wait"] * 1000)
 
 	# Print dimming level vector.
 	def print_dim_levels(self, name="Bulb dimming level map"):
 		try:
-			with open(self.DIM_LEVEL_FILE_NAME, 'r') as f_dim:
-				dim_levels_str = f_dim.read()
-			dim_levels = [float(val) for val in dim_levels_str.split()]
-		
+			dim_levels = self.__load_dim_levels()
+
 			out_map = [['x' for _ in range(3)] for _ in range(3)]
 
 			for bulb_i, dim in enumerate(dim_levels):
@@ -141,14 +479,11 @@ class CeilingActuation:
 			print name+":\n",  DataFrame(out_map), '\n'
 			print "-"*40
 		except IOError:
-			print "Dimming levels file is not found"
+			print "Dimming levels are not found"
 
 	# Get current dimming levels on bulbs.
 	def get_dim_levels(self):
 		try:
-			with open(self.DIM_LEVEL_FILE_NAME, 'r') as f_dim:
-				dim_levels_str = f_dim.read()
-			dim_levels = [float(val) for val in dim_levels_str.split()]
-			return dim_levels
+			return self.__load_dim_levels()
 		except IOError:
-			print "Dimming levels file is not found"
+			print "Dimming levels are not found"
@@ -0,0 +1,67 @@
+"""
+File name: dimming_cache.py
+Author: Yerbol Aussat
+Python Version: 2.7
+
+DimmingCache class is an LRU cache of solutions of the optimal dimming problem, keyed on the target illuminance vector
+(which is already quantized: occupied desks have a fixed target, and targets of portable sensing modules are integers) and
+the environmental illuminance gains E, quantized with a given step (lux). In steady state E only drifts by sensor noise,
+so consecutive problems usually fall into the same cache entry, and the solve is skipped.
+
+To keep cached solutions consistent, problems should be solved for the quantized E (see quantize), so that a cached
+solution is exact for the key it is stored under. Then using it for a nearby E changes illuminance by at most half of the
+quantization step on every sensor.
+"""
+
+from collections import OrderedDict
+import numpy as np
+
+# Constants
+DEFAULT_QUANTIZATION_STEP = 2.0  # lux
+DEFAULT_CAPACITY = 1024
+
+
+class DimmingCache:
+	def __init__(self, quantization_step=DEFAULT_QUANTIZATION_STEP, capacity=DEFAULT_CAPACITY):
+		self.quantization_step = quantization_step
+		self.capacity = capacity
+		self.entries = OrderedDict()  # Key -> solution, from the least to the most recently used.
+		self.n_hits = 0
+		self.n_misses = 0
+
+	def __len__(self):
+		return len(self.entries)
+
+	# Quantize a vector: round it to the nearest multiple of the quantization step.
+	def quantize(self, values):
+		return np.round(np.asarray(values, dtype=float) / self.quantization_step) * self.quantization_step
+
+	# Get cache key for target illuminance target_illum and environmental illuminance gains E.
+	def get_key(self, target_illum, E):
+		return tuple(target_illum), tuple(np.round(np.asarray(E, dtype=float) / self.quantization_step).astype(int))
+
+	# Get the cached solution for the key (None if it's not cached).
+	def get(self, key):
+		solution = self.entries.pop(key, None)
+		if solution is None:
+			self.n_misses += 1
+			return None
+		self.n_hits += 1
+		self.entries[key] = solution  # Mark the entry as the most recently used.
+		return solution
+
+	# Store a solution under the key. If the cache is full, the least recently used entry is evicted.
+	def put(self, key, solution):
+		self.entries.pop(key, None)
+		self.entries[key] = solution
+		if len(self.entries) > self.capacity:
+			self.entries.popitem(last=False)
+
+	# Remove all entries (e.g., when the illuminance model changes). Hit and miss counters are kept.
+	def clear(self):
+		self.entries.clear()
+
+	# Get fraction of lookups that were hits.
+	def get_hit_rate(self):
+		n_lookups = self.n_hits + self.n_misses
+		return float(self.n_hits) / n_lookups if n_lookups else 0.0
@@ -0,0 +1,44 @@
+"""
+File name: dimming_conversion.py
+Author: Yerbol Aussat
+Python Version: 2.7
+
+DimmingConversion class converts dimming levels of Philips Hue bulbs to brightness control values and back. The relation
+between a control value c and the dimming level d that it gives was obtained empirically: d = b_dim + a_dim * c^m_dim,
+so c = ((d - b_dim) / a_dim)^(1 / m_dim). Constants depend on the bulbs.
+
+Conversions work on NumPy arrays of dimming levels (and on scalars). Since the bridge only accepts integer brightness
+codes (0-254), the dimming level that a bulb actually realizes is quantized: an inverse lookup table maps every code to
+its dimming level.
+"""
+
+import numpy as np
+
+# Constants
+MAX_BRIGHTNESS = 254  # Max brightness code accepted by the bridge.
+
+
+class DimmingConversion:
+	def __init__(self, a_dim, m_dim, b_dim):
+		self.a_dim = a_dim
+		self.m_dim = m_dim
+		self.b_dim = b_dim
+		# Inverse lookup table: dimming level realized by every brightness code.
+		self.code_dim_levels = b_dim + a_dim * np.arange(MAX_BRIGHTNESS + 1) ** m_dim
+
+	# Convert dimming levels to control values (not rounded). Dimming levels up to b_dim give 0, dimming levels above 1
+	# give 255, and -1 gives -1.
+	def dim_to_contr(self, d):
+		d = np.asarray(d, dtype=float)
+		control_vals = ((np.clip(d, self.b_dim, 1) - self.b_dim) / self.a_dim) ** (1.0 / self.m_dim)
+		control_vals = np.where(d > 1, 255, control_vals)
+		control_vals = np.where(d == -1, -1, control_vals)
+		return control_vals[()]
+
+	# Get brightness codes (integers in [0, MAX_BRIGHTNESS]) for dimming levels in [0, 1].
+	def get_codes(self, d):
+		return np.clip(np.round(self.dim_to_contr(np.clip(d, 0, 1))), 0, MAX_BRIGHTNESS).astype(int)[()]
+
+	# Get dimming levels realized by brightness codes.
+	def get_dim_levels(self, codes):
+		return self.code_dim_levels[codes]
@@ -0,0 +1,140 @@
+"""
+File name: dimming_lp.py
+Author: Yerbol Aussat
+Python Version: 2.7
+
+DimmingLP class solves the linear program that gives optimal dimming levels of bulbs:
+	minimize c.d, subject to A.d >= t and lower <= d <= upper,
+where A is the illuminance gains matrix, and t is the target illuminance minus the environmental contribution E.
+
+Between consecutive solves only t changes (as E drifts), while A, c and the bounds stay fixed. So the problem structure is
+set up once, and every solve is warm-started from the optimal basis of the previous solve, using the bounded dual simplex
+method. Since c and A don't change, the previous basis stays dual feasible, and it is re-optimized for the new t. Usually
+it's still optimal (0 pivots, i.e., one matrix-vector product with the inverse of the basis matrix, which is kept between
+solves), or a few pivots are needed. The first solve starts from the basis of slack variables, which is dual feasible for
+any c, since every variable d_i is bounded (so no phase 1 is needed).
+
+The solver only depends on NumPy. If the dual simplex method fails (e.g., because of numerical problems), the problem is
+solved from scratch with scipy.optimize.linprog (interior-point method), which is imported only in this case, since
+importing scipy.optimize is slow.
+"""
+
+import time
+from collections import namedtuple
+import numpy as np
+
+# Constants
+FEASIBILITY_TOL = 1e-9  # Relative tolerance for bound violations of basic variables.
+MAX_PIVOTS_PER_CONSTRAINT = 50
+REFACTOR_PERIOD = 20  # Number of pivots after which the inverse of the basis matrix is recomputed from scratch.
+
+# Result of a solve. status: 0 - optimal, 1 - iteration limit reached, 2 - infeasible (as in scipy.optimize.linprog).
+# nit is the number of dual simplex pivots, and solve_time is in seconds.
+DimmingLPResult = namedtuple('DimmingLPResult', ['x', 'fun', 'success', 'status', 'nit', 'warm_start', 'solve_time'])
+
+
+class DimmingLP:
+	def __init__(self, A, c, bounds):
+		A = np.asarray(A, dtype=float)
+		self.n_constraints, self.n_vars = A.shape
+		self.c = np.asarray(c, dtype=float)
+		self.bounds = bounds
+
+		# Standard form: A.d - s = t, where s >= 0 are slack variables. Variables are x = [d, s].
+		self.M = np.hstack((A, -np.eye(self.n_constraints)))
+		self.cost = np.concatenate((self.c, np.zeros(self.n_constraints)))
+		self.lower = np.concatenate(([bound[0] for bound in bounds], np.zeros(self.n_constraints)))
+		self.upper = np.concatenate(([bound[1] for bound in bounds], np.full(self.n_constraints, np.inf)))
+		self.max_pivots = MAX_PIVOTS_PER_CONSTRAINT * (self.n_constraints + self.n_vars)
+		self.__reset_basis()
+
+	# Start the next solve from the basis of slack variables.
+	def __reset_basis(self):
+		# Initial basis: slack variables. Nonbasic variables are at the bound that makes the basis dual feasible.
+		self.basis = range(self.n_vars, self.n_vars + self.n_constraints)
+		self.at_upper = np.zeros(self.n_vars + self.n_constraints, dtype=bool)
+		self.at_upper[:self.n_vars] = self.c < 0
+		self.__refactor()
+		self.warm = False  # Whether the basis is optimal for a previous solve.
+
+	# Compute the inverse of the basis matrix from scratch.
+	def __refactor(self):
+		self.B_inv = np.linalg.inv(self.M[:, self.basis])
+		self.n_updates = 0
+
+	# Solve the linear program for target t.
+	def solve(self, t):
+		start = time.time()
+		t = np.asarray(t, dtype=float)
+		warm_start = self.warm
+		x, status, n_pivots = self.__dual_simplex(t)
+		if status == 1:
+			# Dual simplex method didn't converge: solve from scratch, and start the next solve from slack variables.
+			from scipy.optimize import linprog
+			res = linprog(self.c, A_ub=-self.M[:, :self.n_vars], b_ub=-t, bounds=self.bounds, method='interior-point',
+			              options={"disp": False})
+			x, status = res.x, res.status
+			self.__reset_basis()
+		else:
+			self.warm = status == 0
+		success = status == 0
+		d = np.clip(x[:self.n_vars], self.lower[:self.n_vars], self.upper[:self.n_vars]) if success else None
+		fun = self.c.dot(d) if success else None
+		return DimmingLPResult(d, fun, success, status, n_pivots, warm_start, time.time() - start)
+
+	# Bounded dual simplex method, starting from the current basis. Returns (x, status, number of pivots).
+	def __dual_simplex(self, t):
+		nonbasic = np.ones(len(self.cost), dtype=bool)
+		tol = FEASIBILITY_TOL * max(1.0, np.abs(t).max())
+		for n_pivots in range(self.max_pivots + 1):
+			nonbasic[:] = True
+			nonbasic[self.basis] = False
+
+			# Nonbasic variables are at their bounds; compute values of basic variables.
+			x = np.where(self.at_upper, self.upper, self.lower)
+			x[self.basis] = 0
+			x_B = self.B_inv.dot(t - self.M.dot(x))
+			x[self.basis] = x_B
+
+			# Leaving variable: basic variable with the largest bound violation.
+			lower_violation = self.lower[self.basis] - x_B
+			upper_violation = x_B - self.upper[self.basis]
+			violation = np.maximum(lower_violation, upper_violation)
+			r = np.argmax(violation)
+			if violation[r] <= tol:
+				return x, 0, n_pivots
+
+			# Entering variable: nonbasic variable that keeps the basis dual feasible (dual ratio test).
+			alpha = self.B_inv[r].dot(self.M)
+			if lower_violation[r] > 0:
+				# The leaving variable has to increase to its lower bound.
+				eligible = nonbasic & (((alpha < -tol) & ~self.at_upper) | ((alpha > tol) & self.at_upper))
+			else:
+				# The leaving variable has to decrease to its upper bound.
+				eligible = nonbasic & (((alpha > tol) & ~self.at_upper) | ((alpha < -tol) & self.at_upper))
+			if not eligible.any():
+				return x, 2, n_pivots  # The problem is infeasible.
+			reduced_costs = self.cost - self.cost[self.basis].dot(self.B_inv).dot(self.M)
+			ratios = np.full(len(self.cost), np.inf)
+			ratios[eligible] = np.abs(reduced_costs[eligible] / alpha[eligible])
+			j = np.argmin(ratios)  # Ties are broken by the smallest index.
+
+			# Pivot: the leaving variable becomes nonbasic at the bound it violated.
+			leaving = self.basis[r]
+			self.at_upper[leaving] = lower_violation[r] <= 0
+			self.at_upper[j] = False
+			self.basis[r] = j
+			self.__update_inverse(r, j)
+		return x, 1, self.max_pivots
+
+	# Update the inverse of the basis matrix after variable j replaced the basic variable in row r (product form update,
+	# with periodic recomputation from scratch, so that rounding errors don't accumulate).
+	def __update_inverse(self, r, j):
+		if self.n_updates >= REFACTOR_PERIOD:
+			self.__refactor()
+			return
+		column = self.B_inv.dot(self.M[:, j])
+		self.B_inv[r] /= column[r]
+		column[r] = 0
+		self.B_inv -= np.outer(column, self.B_inv[r])
+		self.n_updates += 1
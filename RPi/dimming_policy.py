@@ -0,0 +1,123 @@
+"""
+File name: dimming_policy.py
+Author: Yerbol Aussat
+Python Version: 2.7
+
+DimmingPolicy class is an explicit (precomputed) solution of the optimal dimming linear program (see dimming_lp.py), in
+the style of explicit model predictive control.
+
+For a fixed target illuminance vector (i.e., an occupancy pattern) and a fixed illuminance gains matrix A, optimal dimming
+levels are a piecewise-affine function of environmental illuminance E. Every piece (region) corresponds to an optimal
+basis of the linear program: basic variables are x_B = B^-1 (target - E - N x_N) = g + G E, where nonbasic variables x_N
+are at their bounds, and G = -B^-1. Since A and the costs are fixed, the basis is dual feasible for any E, so it's optimal
+for every E for which x_B is within its bounds; this inequality defines the region.
+
+Regions are precomputed by solving the linear program for sampled values of E, for every occupancy pattern. At runtime,
+optimal dimming levels are found with a region lookup and a matrix-vector product. If E is not in any known region of the
+pattern (or the pattern is new), the linear program is solved, and the region of its solution is added to the policy.
+Since E drifts slowly, the region that was found last is checked first. Otherwise, all regions of the pattern are checked
+with one tensor-vector product (regions of a pattern are stacked into arrays).
+"""
+
+import time
+import numpy as np
+from dimming_lp import DimmingLPResult
+
+# Constants
+REGION_TOL = 1e-9  # Relative tolerance for bound violations of basic variables.
+
+
+# Region of the policy: optimal basis, and the affine map from E to the basic variables and the dimming levels.
+class PolicyRegion:
+	def __init__(self, dimming_lp, target_illum):
+		basis = list(dimming_lp.basis)
+		n_vars = dimming_lp.n_vars
+		# Values of nonbasic variables (at their bounds).
+		x_fixed = np.where(dimming_lp.at_upper, dimming_lp.upper, dimming_lp.lower)
+		x_fixed[basis] = 0
+		B_inv = np.linalg.inv(dimming_lp.M[:, basis])
+		self.pattern = tuple(target_illum)
+		self.key = (tuple(basis), dimming_lp.at_upper.tostring())
+		self.g = B_inv.dot(target_illum - dimming_lp.M.dot(x_fixed))
+		self.G = -B_inv
+		self.lower = dimming_lp.lower[basis]
+		self.upper = dimming_lp.upper[basis]
+		# Dimming levels: d = d_fixed, except for the basic ones (d[d_indices] = x_B[d_rows]).
+		self.d_fixed = x_fixed[:n_vars]
+		self.d_rows = [row for row, var in enumerate(basis) if var < n_vars]
+		self.d_indices = [basis[row] for row in self.d_rows]
+
+
+class DimmingPolicy:
+	def __init__(self, dimming_lp):
+		self.dimming_lp = dimming_lp
+		self.regions = {}  # Occupancy pattern (target illuminance tuple) -> list of regions.
+		self.stacked_regions = {}  # Occupancy pattern -> (g, G, lower, upper) of its regions, stacked along axis 0.
+		self.n_hits = 0
+		self.n_misses = 0
+		self.last_hit = False  # Whether the last solve was answered by a region lookup.
+		self.last_region = None
+
+	# Precompute regions for the given target illuminance vectors (occupancy patterns) and samples of E.
+	def precompute(self, target_illums, env_gains):
+		for target_illum in target_illums:
+			for E in env_gains:
+				self.__solve_lp(np.asarray(target_illum, dtype=float), E)
+
+	# Get number of regions of all patterns.
+	def get_n_regions(self):
+		return sum(len(regions) for regions in self.regions.values())
+
+	# Get optimal dimming levels for target illuminance target_illum and environmental illuminance gains E.
+	def solve(self, target_illum, E):
+		start = time.time()
+		target_illum = np.asarray(target_illum, dtype=float)
+		E = np.asarray(E, dtype=float)
+		region = self.__find_region(target_illum, E)
+		self.last_hit = region is not None
+		if region is None:
+			self.n_misses += 1
+			res = self.__solve_lp(target_illum, E)
+			return res._replace(solve_time=time.time() - start)
+		self.n_hits += 1
+		d = region.d_fixed.copy()
+		d[region.d_indices] = (region.g + region.G.dot(E))[region.d_rows]
+		n_vars = self.dimming_lp.n_vars
+		d = np.clip(d, self.dimming_lp.lower[:n_vars], self.dimming_lp.upper[:n_vars])
+		return DimmingLPResult(d, self.dimming_lp.c.dot(d), True, 0, 0, True, time.time() - start)
+
+	# Find a region of the pattern that contains E (None if there is no such region).
+	def __find_region(self, target_illum, E):
+		pattern = tuple(target_illum)
+		if pattern not in self.stacked_regions:
+			return None
+		tol = REGION_TOL * max(1.0, np.abs(target_illum - E).max())
+		region = self.last_region
+		if region is not None and region.pattern == pattern:
+			x_B = region.g + region.G.dot(E)
+			if (x_B >= region.lower - tol).all() and (x_B <= region.upper + tol).all():
+				return region
+
+		g, G, lower, upper = self.stacked_regions[pattern]
+		x_B = g + G.dot(E)
+		contains = ((x_B >= lower - tol) & (x_B <= upper + tol)).all(axis=1)
+		i = np.argmax(contains)
+		if not contains[i]:
+			return None
+		self.last_region = self.regions[pattern][i]
+		return self.last_region
+
+	# Solve the linear program, and add the region of its solution to the policy.
+	def __solve_lp(self, target_illum, E):
+		res = self.dimming_lp.solve(target_illum - E)
+		if res.success:
+			region = PolicyRegion(self.dimming_lp, target_illum)
+			pattern = tuple(target_illum)
+			regions = self.regions.setdefault(pattern, [])
+			if region.key not in [known_region.key for known_region in regions]:
+				regions.append(region)
+				self.stacked_regions[pattern] = (np.array([known_region.g for known_region in regions]),
+				                                 np.array([known_region.G for known_region in regions]),
+				                                 np.array([known_region.lower for known_region in regions]),
+				                                 np.array([known_region.upper for known_region in regions]))
+		return res
@@ -0,0 +1,66 @@
+"""
+File name: gain_estimator.py
+Author: Yerbol Aussat
+Python Version: 2.7
+
+GainEstimator class refines illuminance gains matrix A online, from (dimming levels, sensor readings) samples that are
+taken during normal operation (after illuminance settles), so that drift of A (e.g., because of bulb aging, or furniture
+being moved) is absorbed without a full recalibration.
+
+Sensor readings are R = E + A d. Environmental illuminance E changes over time (daylight), so A is estimated from
+changes between consecutive samples: dR = A dd, which doesn't depend on E (it drifts little between samples). Rows of A
+share the regressor dd, so they are estimated with one recursive least squares (RLS) filter with a forgetting factor:
+old samples are discounted, so that A follows drift. Samples are only used if dimming levels changed enough (otherwise
+they carry no information about A), and the trace of the covariance matrix is bounded, so that it doesn't blow up while
+dimming levels stay the same (and the estimate doesn't jump when they change again).
+"""
+
+import numpy as np
+
+# Constants
+DEFAULT_FORGETTING_FACTOR = 0.98
+DEFAULT_INITIAL_COVARIANCE = 10.0  # Initial covariance of gains of every bulb (confidence in the calibrated A).
+DEFAULT_MAX_COVARIANCE_TRACE = 1000.0
+DEFAULT_MIN_EXCITATION = 0.02  # Min change of a dimming level between samples, for them to be used.
+
+
+class GainEstimator:
+	def __init__(self, A, forgetting_factor=DEFAULT_FORGETTING_FACTOR, initial_covariance=DEFAULT_INITIAL_COVARIANCE,
+	             max_covariance_trace=DEFAULT_MAX_COVARIANCE_TRACE, min_excitation=DEFAULT_MIN_EXCITATION):
+		self.A = np.array(A, dtype=float)
+		self.forgetting_factor = forgetting_factor
+		self.max_covariance_trace = max_covariance_trace
+		self.min_excitation = min_excitation
+		self.P = np.eye(self.A.shape[1]) * initial_covariance  # Covariance matrix (shared by rows of A).
+		self.prev_sample = None  # Previous (dimming levels, sensor readings).
+		self.n_updates = 0
+
+	# Add a sample: dimming levels d and sensor readings R. Returns True if A was updated.
+	def update(self, d, R):
+		d = np.asarray(d, dtype=float)
+		R = np.asarray(R, dtype=float)
+		prev_sample = self.prev_sample
+		self.prev_sample = (d, R)
+		if prev_sample is None:
+			return False
+		delta_d = d - prev_sample[0]
+		delta_R = R - prev_sample[1]
+		if np.abs(delta_d).max() < self.min_excitation:
+			return False
+
+		P_delta_d = self.P.dot(delta_d)
+		gain = P_delta_d / (self.forgetting_factor + delta_d.dot(P_delta_d))
+		error = delta_R - self.A.dot(delta_d)
+		# Gains are nonnegative (negative estimates are caused by sensor noise).
+		self.A = np.clip(self.A + np.outer(error, gain), 0, None)
+		self.P = (self.P - np.outer(gain, P_delta_d)) / self.forgetting_factor
+		self.P = (self.P + self.P.T) / 2  # Keep P symmetric despite rounding errors.
+		trace = np.trace(self.P)
+		if trace > self.max_covariance_trace:
+			self.P *= self.max_covariance_trace / trace
+		self.n_updates += 1
+		return True
+
+	# Get environmental illuminance gains E for dimming levels d and sensor readings R.
+	def get_env_gain(self, d, R):
+		return np.asarray(R, dtype=float) - self.A.dot(d)
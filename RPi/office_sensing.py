@@ -4,19 +4,38 @@ Author: Yerbol Aussat
 Python Version: 2.7
 
 OfficeSensing class abstacts away communication with individual sensing modules in the smart lighting system.
+
+Sensing modules can either be polled ("Read" request / reply), or switched to push mode (see start_streaming), in which
+each module streams its readings over the same connection, and the latest frame of each module is kept in memory.
 """
 
+import time
+import socket
+from threading import Thread
+from threading import Condition
+from multiprocessing.pool import ThreadPool
 from sensing_module import SensingModule
 
+# Constants
+POLLING_POOL_SIZE = 16  # Number of worker threads used for polling sensing modules concurrently.
+DEFAULT_STREAMING_RATE = 10  # Frames per second pushed by each sensing module in push mode.
+
 
 class OfficeSensing:
-	def __init__(self, addresses, light_calibration_const):
+	def __init__(self, addresses, light_calibration_const, concurrent_polling=True):
+		# Reusable pool of worker threads that send requests to all sensing modules at once (None - poll modules
+		# one by one).
+		self.polling_pool = ThreadPool(POLLING_POOL_SIZE) if concurrent_polling else None
+		# Push mode: latest frame received from each sensing module, {module: (receive time, frame)}.
+		self.streaming_rate = None
+		self.latest_frames = {}
+		self.frames_updated = Condition()
 		try:
 			self.sens_modules = []
 			self.light_calibration_const = light_calibration_const
 			for ip, port in addresses:
 				module = SensingModule(ip, port)
-				print "[*]", module.send_msg("Check connection")
+				print "[*]", module.check_connection()
 				self.sens_modules.append(module)
 			print "[*] Successfully connected to sensing modules"
 		except:
@@ -31,6 +50,8 @@ class OfficeSensing:
 
 	# Add sensing module to the system.
 	def add_portable_module(self, module, calibr_const):
+		if self.streaming_rate:
+			self.__subscribe(module)
 		self.sens_modules.append(module)
 		self.light_calibration_const.append(calibr_const)
 
@@ -40,12 +61,84 @@ class OfficeSensing:
 		del self.sens_modules[i]
 		del self.light_calibration_const[i]
 
+	# Switch all sensing modules to push mode. Each sensing module pushes its readings at the given rate (frames per
+	# second), and a receiver thread per module keeps its latest frame, so that readings can be obtained without any
+	# network wait (see get_latest_readings).
+	def start_streaming(self, rate=DEFAULT_STREAMING_RATE):
+		self.streaming_rate = rate
+		for module in self.sens_modules:
+			self.__subscribe(module)
+		print "[*] Sensing modules are streaming readings ({} frames per second)".format(rate)
+
+	# Subscribe to readings of a sensing module, and start a thread that receives them.
+	def __subscribe(self, module):
+		module.subscribe(self.streaming_rate)
+		thread = Thread(target=self.__receive_frames, args=(module, ))
+		thread.daemon = True
+		thread.start()
+
+	# Thread that keeps receiving frames pushed by a sensing module, until it stops streaming.
+	def __receive_frames(self, module):
+		while True:
+			try:
+				frame = module.recv_frame()
+			except (socket.error, ValueError), e:
+				print "\n ERROR: Streaming from sensing module failed\n", str(e)
+				module.streaming = False
+				frame = None
+			with self.frames_updated:
+				if frame is None:
+					self.latest_frames.pop(module, None)
+				else:
+					self.latest_frames[module] = (time.time(), frame)
+				self.frames_updated.notify_all()
+			if frame is None:
+				break
+
+	# Wait until every sensing module has a frame received after the given time, and return these frames.
+	def __wait_for_frames(self, received_after=0):
+		with self.frames_updated:
+			while True:
+				frames = []
+				for i, module in enumerate(self.sens_modules):
+					if not module.streaming:
+						raise IOError("Sensing module {} stopped streaming".format(i))
+					if module not in self.latest_frames or self.latest_frames[module][0] <= received_after:
+						break
+					frames.append(self.latest_frames[module][1])
+				else:
+					return frames
+				self.frames_updated.wait()
+
 	# Get light and occupancy readings from sensing modules.
+	# When concurrent polling is enabled, read requests are sent to all sensing modules at once, so a sweep takes about as
+	# long as the slowest round-trip (rather than the sum of all round-trips).
+	# In push mode, this method waits for the next frame from every sensing module, so that the readings are taken
+	# after the call (e.g., after bulbs were dimmed).
 	def get_sensor_readings(self):
+		if self.streaming_rate:
+			frames = self.__wait_for_frames(received_after=time.time())
+			return self.__to_readings([(light, occupancy) for _, light, occupancy in frames])
+
+		if self.polling_pool:
+			raw_readings = self.polling_pool.map(lambda module: module.read(), self.sens_modules)
+		else:
+			raw_readings = [sens_module.read() for sens_module in self.sens_modules]
+		return self.__to_readings(raw_readings)
+
+	# Get the latest light and occupancy readings received from sensing modules in push mode. Unlike
+	# get_sensor_readings, this method doesn't wait for the network (except until the first frame of each module arrives).
+	def get_latest_readings(self):
+		if not self.streaming_rate:
+			return self.get_sensor_readings()
+		frames = self.__wait_for_frames()
+		return self.__to_readings([(light, occupancy) for _, light, occupancy in frames])
+
+	# Convert raw (light, occupancy) values of sensing modules to light and occupancy readings.
+	def __to_readings(self, raw_readings):
 		light_readings = []
 		occupancy_readings = []
-		for i, sens_module in enumerate(self.sens_modules):
-			received_message = sens_module.send_msg("Read")
-			light_readings.append(int(received_message.split()[0])*self.light_calibration_const[i])
-			occupancy_readings.append(int(received_message.split()[1]))
+		for i, (light_reading, occupancy_reading) in enumerate(raw_readings):
+			light_readings.append(light_reading*self.light_calibration_const[i])
+			occupancy_readings.append(occupancy_reading)
 		return light_readings, occupancy_readings
@@ -20,6 +20,8 @@ import os
 import platform
 import sys
 import socket
+import threading
+import time
 if sys.version_info[0] > 2:
     PY3K = True
 else:
@@ -27,8 +29,10 @@ else:
 
 if PY3K:
     import http.client as httplib
+    import queue
 else:
     import httplib
+    import Queue as queue
 
 logger = logging.getLogger('phue')
 
@@ -41,6 +45,12 @@ else:
 __version__ = '1.1'
 
 
+DEFAULT_POOL_SIZE = 8
+REQUEST_TIMEOUT = 10
+LIGHT_STATE_TTL = 1.0  # seconds
+IDEMPOTENT_METHODS = ('GET', 'PUT', 'DELETE')  # Requests that can be sent again
+
+
 def is_string(data):
     """Utility method to see if data is a string."""
     if PY3K:
@@ -64,6 +74,56 @@ class PhueRequestTimeout(PhueException):
     pass
 
 
+class ConnectionPool(object):
+
+    """ Thread-safe pool of persistent (keep-alive) HTTP connections to a host
+
+    At most max_size connections are in use at the same time; a thread that
+    needs a connection when all of them are in use waits until one is
+    released. Released connections are kept open and reused by subsequent
+    requests, so that they don't pay a TCP handshake. A connection that
+    failed, or that the server is going to close, is discarded.
+    """
+
+    def __init__(self, host, max_size=DEFAULT_POOL_SIZE, timeout=REQUEST_TIMEOUT):
+        self.host = host
+        self.timeout = timeout
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(max_size)
+
+    def new_connection(self):
+        """ Open a new connection (it's connected on the first request)"""
+        return httplib.HTTPConnection(self.host, timeout=self.timeout)
+
+    def acquire(self):
+        """ Get an idle connection, or a new one if there is none
+
+        Returns (connection, reused), where reused is True if the
+        connection came from the idle pool.
+        """
+        self._slots.acquire()
+        try:
+            return self._idle.get_nowait(), True
+        except queue.Empty:
+            return self.new_connection(), False
+
+    def release(self, connection, reusable=True):
+        """ Return a connection to the pool (it's closed if it's not reusable)"""
+        if reusable:
+            self._idle.put(connection)
+        else:
+            connection.close()
+        self._slots.release()
+
+    def close(self):
+        """ Close idle connections"""
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                return
+
+
 class Light(object):
 
     """ Hue Light object
@@ -144,6 +204,8 @@ class Light(object):
 
     @on.setter
     def on(self, value):
+        if self._on is None:
+            self._on = self._get('on')
 
         # Some added code here to work around known bug where
         # turning off with transitiontime set makes it restart on brightness = 1
@@ -190,6 +252,47 @@ class Light(object):
         self._brightness = value
         self._set('bri', self._brightness)
 
+    def set_state(self, on=None, brightness=None, transitiontime=None):
+        """ Set on/off state and brightness of the light with one request
+
+        Arguments that are None are not changed. Fields that match the last
+        known state of the light (the last value that was set or read through
+        this object) are skipped, and no request is sent if nothing changes.
+        Brightness is not sent when the light is turned off, since the bridge
+        doesn't accept it for lights that are off.
+
+        Returns the bridge's response (None if no request was sent).
+        """
+        state = {}
+        if on is not None and on != self._on:
+            state['on'] = on
+        light_on = on if on is not None else self._on
+        if brightness is not None and brightness != self._brightness and light_on is not False:
+            state['bri'] = brightness
+        if not state:
+            return None
+        if transitiontime is None:
+            transitiontime = self.transitiontime
+
+        result = self.bridge.set_light(self.light_id, state, transitiontime=transitiontime)
+        # Update the last known state only with the fields that the bridge confirmed.
+        for item in result[0]:
+            for address in item.get('success', {}):
+                if address.endswith('/on'):
+                    self._on = state['on']
+                elif address.endswith('/bri'):
+                    self._brightness = state['bri']
+        return result
+
+    def forget_state(self):
+        """ Forget the last known on/off state and brightness of the light
+
+        Used when the light may have been changed by another client, so that
+        the next set_state sends all of its fields.
+        """
+        self._on = None
+        self._brightness = None
+
     @property
     def hue(self):
         '''Get or set the hue of the light [0-65535]'''
@@ -595,7 +698,7 @@ class Bridge(object):
 
 
     """
-    def __init__(self, ip=None, username=None, config_file_path=None):
+    def __init__(self, ip=None, username=None, config_file_path=None, light_state_ttl=LIGHT_STATE_TTL):
         """ Initialization function.
 
         Parameters:
@@ -603,6 +706,9 @@ class Bridge(object):
         ip : string
             IP address as dotted quad
         username : string, optional
+        light_state_ttl : float, optional
+            Time (in seconds) that light states fetched from the bridge are
+            served from the cache (0 - light states are not cached)
 
         """
 
@@ -622,6 +728,12 @@ class Bridge(object):
         self.sensors_by_id = {}
         self.sensors_by_name = {}
         self._name = None
+        self._pool = None
+        self._pool_lock = threading.Lock()
+        self.light_state_ttl = light_state_ttl
+        self._light_states = {}
+        self._light_states_time = None
+        self._light_states_lock = threading.Lock()
 
         # self.minutes = 600 # these do not seem to be used anywhere?
         # self.seconds = 10
@@ -642,27 +754,64 @@ class Bridge(object):
         self.request(
             'PUT', '/api/' + self.username + '/config', data)
 
-    def request(self, mode='GET', address=None, data=None):
-        """ Utility function for HTTP GET/PUT requests for the API"""
-        connection = httplib.HTTPConnection(self.ip, timeout=10)
+    def _get_pool(self):
+        """ Get the pool of connections to the bridge (a new one is created if the ip changed)"""
+        with self._pool_lock:
+            if self._pool is None or self._pool.host != self.ip:
+                if self._pool is not None:
+                    self._pool.close()
+                self._pool = ConnectionPool(self.ip)
+            return self._pool
+
+    def close_connections(self):
+        """ Close idle connections to the bridge"""
+        with self._pool_lock:
+            if self._pool is not None:
+                self._pool.close()
 
+    def request(self, mode='GET', address=None, data=None):
+        """ Utility function for HTTP GET/PUT requests for the API
+
+        Requests are sent over persistent connections from the connection
+        pool. If a request over an idle connection from the pool fails (the
+        bridge may have closed it), GET, PUT and DELETE requests are retried
+        once over a new connection. Other requests (e.g., POST, which would
+        create duplicate resources if the bridge received the first one) and
+        failures on new connections are raised.
+        """
+        pool = self._get_pool()
+        connection, reused = pool.acquire()
+        reusable = False
         try:
-            if mode == 'GET' or mode == 'DELETE':
-                connection.request(mode, address)
-            if mode == 'PUT' or mode == 'POST':
-                connection.request(mode, address, json.dumps(data))
-
-            logger.debug("{0} {1} {2}".format(mode, address, str(data)))
-
-        except socket.timeout:
-            error = "{} Request to {}{} timed out.".format(mode, self.ip, address)
+            while True:
+                try:
+                    if mode == 'GET' or mode == 'DELETE':
+                        connection.request(mode, address)
+                    if mode == 'PUT' or mode == 'POST':
+                        connection.request(mode, address, json.dumps(data))
+
+                    logger.debug("{0} {1} {2}".format(mode, address, str(data)))
+
+                    result = connection.getresponse()
+                    response = result.read()
+                    reusable = not result.will_close
+                    break
+
+                except socket.timeout:
+                    error = "{} Request to {}{} timed out.".format(mode, self.ip, address)
+
+                    logger.exception(error)
+                    raise PhueRequestTimeout(None, error)
+
+                except (httplib.HTTPException, socket.error):
+                    connection.close()
+                    if not reused or mode not in IDEMPOTENT_METHODS:
+                        raise
+                    logger.debug("Connection to {} is closed, reconnecting".format(self.ip))
+                    connection, reused = pool.new_connection(), False
+        finally:
+            pool.release(connection, reusable)
 
-            logger.exception(error)
-            raise PhueRequestTimeout(None, error)
-
-        result = connection.getresponse()
-        response = result.read()
-        connection.close()
         if PY3K:
             return json.loads(response.decode('utf-8'))
         else:
@@ -751,6 +900,33 @@ class Bridge(object):
                     'Error opening config file, will attempt bridge registration')
                 self.register_app()
 
+    def get_light_states(self, refresh=False):
+        """ Get states of all lights: a dict of light ids to light dicts
+
+        States are fetched with one GET /lights request, and are served from
+        the cache for light_state_ttl seconds. Lights that were written to
+        since then (see invalidate_light_state), or that are not in the
+        cache, make the next call fetch the states of all lights again.
+        """
+        with self._light_states_lock:
+            expired = (self._light_states_time is None or
+                       time.time() - self._light_states_time >= self.light_state_ttl)
+            if refresh or expired or None in self._light_states.values():
+                lights = self.request('GET', '/api/' + self.username + '/lights/')
+                if not isinstance(lights, dict):
+                    return lights  # Error message of the bridge
+                self._light_states = lights
+                self._light_states_time = time.time()
+            return dict(self._light_states)
+
+    def invalidate_light_state(self, light_id=None):
+        """ Mark cached state of a light (of all lights if light_id is None) as outdated"""
+        with self._light_states_lock:
+            if light_id is None:
+                self._light_states_time = None
+            elif str(light_id) in self._light_states:
+                self._light_states[str(light_id)] = None
+
     def get_light_id_by_name(self, name):
         """ Lookup a light id based on string name. Case-sensitive. """
         lights = self.get_light()
@@ -768,7 +944,7 @@ class Bridge(object):
         The returned collection can be either a list (default), or a dict.
         Set mode='id' for a dict by light ID, or mode='name' for a dict by light name.   """
         if self.lights_by_id == {}:
-            lights = self.request('GET', '/api/' + self.username + '/lights/')
+            lights = self.get_light_states()
             for light in lights:
                 self.lights_by_id[int(light)] = Light(self, int(light))
                 self.lights_by_name[lights[light][
@@ -843,9 +1019,14 @@ class Bridge(object):
         if is_string(light_id):
             light_id = self.get_light_id_by_name(light_id)
         if light_id is None:
-            return self.request('GET', '/api/' + self.username + '/lights/')
-        state = self.request(
-            'GET', '/api/' + self.username + '/lights/' + str(light_id))
+            return self.get_light_states()
+        state = self.get_light_states().get(str(light_id))
+        if state is None:
+            state = self.get_light_states(refresh=True).get(str(light_id))
+        if state is None:
+            # Unknown light: the bridge replies with an error message.
+            state = self.request(
+                'GET', '/api/' + self.username + '/lights/' + str(light_id))
         if parameter is None:
             return state
         if parameter in ['name', 'type', 'uniqueid', 'swversion']:
@@ -889,6 +1070,7 @@ class Bridge(object):
             if parameter == 'name':
                 result.append(self.request('PUT', '/api/' + self.username + '/lights/' + str(
                     light_id), data))
+                self.invalidate_light_state(light_id)
             else:
                 if is_string(light):
                     converted_light = self.get_light_id_by_name(light)
@@ -896,6 +1078,7 @@ class Bridge(object):
                     converted_light = light
                 result.append(self.request('PUT', '/api/' + self.username + '/lights/' + str(
                     converted_light) + '/state', data))
+                self.invalidate_light_state(converted_light)
             if 'error' in list(result[-1][0].keys()):
                 logger.warn("ERROR: {0} for light {1}".format(
                     result[-1][0]['error']['description'], light))
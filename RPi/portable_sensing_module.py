@@ -7,17 +7,13 @@ PortableSensingModule class initializes connection with a portable sensing modul
 communication with it.
 """
 
+from sensing_module import SensingModule
 
-class PortableSensingModule:
-	def __init__(self, client):
+
+# Portable sensing modules connect to the control module themselves, so the connection (client socket) is created by
+# the control module's listener, and the protocol version is reported by the portable sensing module when it connects.
+# Communication is the same as with "per-desk" sensing modules.
+class PortableSensingModule(SensingModule):
+	def __init__(self, client, protocol_version=None):
 		# IPV-4 address, TCP-oriented socket.
-		self.client = client
-		
-	# Send a message msg to the sensing module.
-	def send_msg(self, msg):
-		self.client.send(msg)
-		return self.client.recv(1024)
-	
-	# Disconnect from the sensing module.
-	def disconnect(self):
-		self.send_msg("disconnect")
+		self._setup_connection(client, protocol_version)
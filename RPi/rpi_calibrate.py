@@ -9,27 +9,69 @@ Note:
 - IP addresses, port numbers and calibration constants of "per-desk" sensing modules should be specified in the
 SENS_MODULE_CONFIG_FILE_NAME file.
 - IP adress of the Philips Hue bridge should be specified in PHUE_IP_ADDRESS.
+- Matrices A and E are stored persistently in ILLUM_GAIN_MTX_FILE_NAME and ENV_GAIN_FILE_NAME files. If the state bus
+(see state_bus.py) is provided, they are also published to the other processes through it.
+
+Illuminance gains are measured either sequentially (one bulb is perturbed at a time), or with Hadamard-coded patterns,
+where about half of the bulbs are perturbed at once in every pattern, and all columns of A are recovered by least
+squares from the stacked sensor responses. Both methods take n_bulbs + 1 measurements (one pattern per bulb, plus the
+unperturbed readings), so the Hadamard method doesn't shorten calibration, and the blackout while a portable sensing
+module is integrated (the optimizer is paused during calibration) stays the same. Patterns are rows of an S-matrix
+(derived from a Sylvester-Hadamard matrix): for 3, 5 and 6 bulbs the noise variance of every gain is half of the one
+of the sequential method (a quarter for 7 bulbs), for 1, 2, 4 and 8 bulbs some gains are as noisy as with the
+sequential method. Measurements can be repeated for noise averaging, and the result can be compared with the
+sequential method.
+
+After every change of dimming levels, calibration waits until sensor readings settle (see settle_detection.py), for at
+most wait_time seconds.
+
+At startup (see initialize_model), matrix A that was stored persistently is reused if it passes a quick validation: two
+complementary multi-bulb patterns (so that every bulb is perturbed) are applied, and changes of sensor readings are
+compared with the ones predicted by A. Full initial calibration is only run if the prediction error exceeds the
+tolerance (or there is no stored A that fits the system).
 """
 
 from office_sensing import OfficeSensing
 from ceiling_actuation import CeilingActuation
+from settle_detection import SettleDetector
 import numpy as np
 from pandas import DataFrame
 import argparse
 import time
+import math
+import os
 
 # Constants
 SENS_MODULE_CONFIG_FILE_NAME = 'sensing_module_list.txt'
 PHUE_IP_ADDRESS = '192.168.0.2'
 ILLUM_GAIN_MTX_FILE_NAME = 'illum_gain.npy'  # File name where illuminance gains matrix is stored persistently.
 ENV_GAIN_FILE_NAME = 'env_gain.npy'  # File name where environmental illuminance gains are stored persistently.
+# Calibration methods.
+SEQUENTIAL_CALIBRATION = 'sequential'
+HADAMARD_CALIBRATION = 'hadamard'
+# Validation of the stored matrix A: tolerance of the prediction error of sensor reading changes (the larger of the
+# absolute tolerance and the relative one, times the predicted change).
+VALIDATION_TOLERANCE = 15.0  # lux
+VALIDATION_RELATIVE_TOLERANCE = 0.2
 
 
 # Calibration process.
-def calibrate(sensors, actuators=None, step=0.35, B=0.65, wait_time=2, initial_calibration=False):
+# @param method: SEQUENTIAL_CALIBRATION or HADAMARD_CALIBRATION
+# @param n_repeats: number of times the measurements are repeated (Hadamard method only)
+# @param compare_with_sequential: if True, gains are also measured sequentially after the Hadamard method, and the
+# difference is reported
+# @param settle_detection: if False, calibration waits for wait_time seconds after every change of dimming levels
+# If actuators are not given, CeilingActuation is created for the calibration (and closed after it).
+def calibrate(sensors, actuators=None, step=0.35, B=0.65, wait_time=2, initial_calibration=False, state_bus=None,
+              method=SEQUENTIAL_CALIBRATION, n_repeats=1, compare_with_sequential=False, settle_detection=True):
 	if not actuators:
-		actuators = CeilingActuation(PHUE_IP_ADDRESS)
-	n_sensors = len(sensors.sens_modules)
+		actuators = CeilingActuation(PHUE_IP_ADDRESS, state_bus)
+		try:
+			return calibrate(sensors, actuators, step, B, wait_time, initial_calibration, state_bus, method, n_repeats,
+			                 compare_with_sequential, settle_detection)
+		finally:
+			actuators.close()
+	settle_detector = SettleDetector(lambda: sensors.get_latest_readings()[0]) if settle_detection else None
 
 	# NOTE: "8" is hardcoded below, which means that the system supports at most 8 bulbs. This was done because if
 	# other Philips Hue bulbs (not belonging to the system) were connected to the bridge at the moment of
@@ -40,7 +82,7 @@ def calibrate(sensors, actuators=None, step=0.35, B=0.65, wait_time=2, initial_c
 		print "*" * 25, "\n", "Initial Calibration."
 		# Start with setting all bulbs to dimming level of 0.8.
 		dim_calibr = [0.8] * n_bulbs
-		actuators.set_dimming(dim_calibr, wait_time)
+		actuators.set_dimming(dim_calibr, wait_time, settle_detector)
 	else:
 		print "*" * 25, "\n", "Calibration."
 
@@ -53,25 +95,39 @@ def calibrate(sensors, actuators=None, step=0.35, B=0.65, wait_time=2, initial_c
 	if not dim_levels:
 		return
 		
-	# Apply calibration routine to each bulb j one by one.
-	A = np.zeros(shape=(n_sensors, n_bulbs))
-	for j in range(n_bulbs):
-		print "\n", "-"*40, "\nBULB:", j
-		# Compare dimming level with the pivot
-		S = step if dim_levels[j] > B else -step
-		actuators.change_dim_on_bulb(j, -S, wait_time)		
-		R_prime, _ = sensors.get_sensor_readings()
-		print " => R_prime:", R_prime
-		A[:, j] = np.array([abs(R_prime[i] - R[i]) / step for i in range(n_sensors)])
-		actuators.change_dim_on_bulb(j, S, 0)  # Wait time here is 0 since we don't measure illuminance after this step.
-	time.sleep(wait_time)
+	if method == HADAMARD_CALIBRATION:
+		measurement_start = time.time()
+		A, fit_residual = measure_gains_hadamard(sensors, actuators, dim_levels[:n_bulbs], R, step, B, wait_time,
+		                                         n_repeats, settle_detector)
+		hadamard_duration = time.time() - measurement_start
+		if fit_residual is not None:
+			print "\nRMS residual of the least squares fit: {:.2f} lux".format(fit_residual)
+		if compare_with_sequential:
+			measurement_start = time.time()
+			A_sequential = measure_gains_sequential(sensors, actuators, dim_levels, R, step, B, wait_time, n_bulbs,
+			                                        settle_detector)
+			sequential_duration = time.time() - measurement_start
+			print "\nSequential illuminance gains matrix:\n", DataFrame(A_sequential)
+			print "Measurement duration: {:.1f} s (Hadamard, {} repeats), {:.1f} s (sequential)".format(
+				hadamard_duration, n_repeats, sequential_duration)
+			print "Difference from the sequential method: max {:.2f} lux, relative {:.1f}%".format(
+				np.abs(A - A_sequential).max(),
+				100 * np.linalg.norm(A - A_sequential) / max(np.linalg.norm(A_sequential), 1e-9))
+	else:
+		A = measure_gains_sequential(sensors, actuators, dim_levels, R, step, B, wait_time, n_bulbs, settle_detector)
+	if settle_detector:
+		settle_detector.wait(wait_time)
+	else:
+		time.sleep(wait_time)
 
 	# Update matrices A and E
 	d = np.array(dim_levels)
 	R = np.array(R)
 	E = R - A.dot(d)
 	if not initial_calibration:
-		A_prev = np.load(ILLUM_GAIN_MTX_FILE_NAME)
+		A_prev, E_prev = state_bus.get_model() if state_bus else (None, None)
+		if A_prev is None:
+			A_prev, E_prev = np.load(ILLUM_GAIN_MTX_FILE_NAME), np.load(ENV_GAIN_FILE_NAME)
 		if A.shape[0] > A_prev.shape[0]:
 			# We get here only when we integrate new sensing modules into the system.
 			A[:A_prev.shape[0], :] = A_prev
@@ -79,13 +135,14 @@ def calibrate(sensors, actuators=None, step=0.35, B=0.65, wait_time=2, initial_c
 		# Keeping previous environmental illuminance gain values (for "old" sensing modules) when integrating new
 		# sensing modules helps to achieve seamless integration. (The effect of this is particularly apparent
 		# when A is not very accurate.)
-		E_prev = np.load(ENV_GAIN_FILE_NAME)
 		if E.shape[0] > E_prev.shape[0]:
 			# We get here only when we integrate new sensing modules into the system.
 			E[:E_prev.shape[0]] = E_prev
 
 	np.save(ILLUM_GAIN_MTX_FILE_NAME, A)
 	np.save(ENV_GAIN_FILE_NAME, E)
+	if state_bus:
+		state_bus.set_model(A, E)
 	print '-'*38
 	print "Illuminance Contributon Matrix:"
 	print DataFrame(A)
@@ -94,6 +151,178 @@ def calibrate(sensors, actuators=None, step=0.35, B=0.65, wait_time=2, initial_c
 	print "Calibration is completed\n", "*" * 40
 
 
+# Set up illuminance model (matrices A and E) at startup. Matrix A that is stored in ILLUM_GAIN_MTX_FILE_NAME is reused
+# if it passes validation (see validate_model), and E is estimated for the current dimming levels. Otherwise, initial
+# calibration is run. Returns True if the stored A was reused.
+# If actuators are not given, CeilingActuation is created for the initialization (and closed after it).
+def initialize_model(sensors, actuators=None, step=0.35, B=0.65, wait_time=2, state_bus=None, settle_detection=True):
+	if not actuators:
+		actuators = CeilingActuation(PHUE_IP_ADDRESS, state_bus)
+		try:
+			return initialize_model(sensors, actuators, step, B, wait_time, state_bus, settle_detection)
+		finally:
+			actuators.close()
+	settle_detector = SettleDetector(lambda: sensors.get_latest_readings()[0]) if settle_detection else None
+	n_sensors = len(sensors.sens_modules)
+	n_bulbs = min(8, len(actuators.lights))
+	start = time.time()
+	print "*" * 25, "\n", "Validation of the stored illuminance model."
+
+	A = np.load(ILLUM_GAIN_MTX_FILE_NAME) if os.path.isfile(ILLUM_GAIN_MTX_FILE_NAME) else None
+	# Rows of portable sensing modules come after the "per-desk" ones, so they are dropped if these modules aren't
+	# connected.
+	if A is None or A.shape[0] < n_sensors or A.shape[1] != n_bulbs:
+		print "Stored matrix A doesn't fit the system."
+		calibrate(sensors, actuators, step, B, wait_time, initial_calibration=True, state_bus=state_bus,
+		          settle_detection=settle_detection)
+		return False
+	A = A[:n_sensors]
+
+	# Start with setting all bulbs to dimming level of 0.8 (as initial calibration does).
+	actuators.set_dimming([0.8] * n_bulbs, wait_time, settle_detector)
+	R, _ = sensors.get_sensor_readings()
+	d = np.array(actuators.get_dim_levels()[:n_bulbs])
+	valid = validate_model(sensors, actuators, A, d, R, step, B, wait_time, settle_detector)
+	actuators.set_dimming(d.tolist(), 0)
+	if not valid:
+		calibrate(sensors, actuators, step, B, wait_time, initial_calibration=True, state_bus=state_bus,
+		          settle_detection=settle_detection)
+		return False
+
+	if settle_detector:
+		settle_detector.wait(wait_time)
+	else:
+		time.sleep(wait_time)
+	E = np.array(R) - A.dot(d)
+	np.save(ILLUM_GAIN_MTX_FILE_NAME, A)
+	np.save(ENV_GAIN_FILE_NAME, E)
+	if state_bus:
+		state_bus.set_model(A, E)
+	print "\nVector E (Environment contribution):\n", E
+	print "Duration of validation: ", time.time() - start
+	print "Stored illuminance model is reused\n", "*" * 40
+	return True
+
+
+# Validate illuminance gains matrix A: apply validation patterns (perturbations of dimming levels d, as in
+# measure_gains_hadamard), and compare changes of sensor readings from R with the ones predicted by A.
+# Returns True if all prediction errors are within the tolerance.
+def validate_model(sensors, actuators, A, d, R, step, B, wait_time, settle_detector=None):
+	S = np.where(d > B, step, -step)
+	patterns = get_validation_patterns(len(d))
+	valid = True
+	for k, pattern in enumerate(patterns):
+		print "\n", "-"*40, "\nVALIDATION PATTERN {}: {}".format(k, pattern.astype(int))
+		actuators.set_dimming((d - pattern * S).tolist(), wait_time, settle_detector)
+		R_prime, _ = sensors.get_sensor_readings()
+		d_prime = np.array(actuators.get_dim_levels()[:len(d)])
+		predicted_change = A.dot(d_prime - d)
+		error = np.abs(np.array(R_prime) - np.array(R) - predicted_change)
+		tolerance = np.maximum(VALIDATION_TOLERANCE, VALIDATION_RELATIVE_TOLERANCE * np.abs(predicted_change))
+		print " => R_prime:", R_prime
+		print " => Prediction error:", error
+		print_settle_time(settle_detector)
+		if (error > tolerance).any():
+			print "Prediction error exceeds the tolerance (sensors {}).".format(
+				np.nonzero(error > tolerance)[0].tolist())
+			valid = False
+			break
+	return valid
+
+
+# Get validation patterns for n_bulbs bulbs, one per row: the first Hadamard pattern (it perturbs about half of the
+# bulbs), and its complement. Every bulb is perturbed, so every column of A is checked (perturbing all bulbs at once
+# would check them too, but the relative tolerance of the change caused by all bulbs would mask errors of single
+# columns).
+def get_validation_patterns(n_bulbs):
+	if n_bulbs == 1:
+		return np.ones((1, 1))
+	split = get_hadamard_patterns(n_bulbs)[0]
+	return np.array([split, 1 - split])
+
+
+# Measure illuminance gains matrix A by perturbing dimming level of each bulb j one by one (R - sensor readings before
+# the perturbations).
+def measure_gains_sequential(sensors, actuators, dim_levels, R, step, B, wait_time, n_bulbs, settle_detector=None):
+	n_sensors = len(R)
+	A = np.zeros(shape=(n_sensors, n_bulbs))
+	for j in range(n_bulbs):
+		print "\n", "-"*40, "\nBULB:", j
+		# Compare dimming level with the pivot
+		S = step if dim_levels[j] > B else -step
+		actuators.change_dim_on_bulb(j, -S, wait_time, settle_detector)
+		R_prime, _ = sensors.get_sensor_readings()
+		print " => R_prime:", R_prime
+		print_settle_time(settle_detector)
+		A[:, j] = np.array([abs(R_prime[i] - R[i]) / step for i in range(n_sensors)])
+		actuators.change_dim_on_bulb(j, S, 0)  # Wait time here is 0 since we don't measure illuminance after this step.
+	return A
+
+
+# Get Hadamard perturbation patterns for n_bulbs bulbs, one per row (1 - the bulb is perturbed). Rows are taken from the
+# first n_bulbs columns of the S-matrix (J - H') / 2, where H' is the Sylvester-Hadamard matrix of the smallest order
+# (a power of 2) that is larger than n_bulbs, without its first row and column, and J is the all-ones matrix. Rows that
+# don't increase the rank are skipped, so the n_bulbs patterns (and the unperturbed one) determine gains of all bulbs.
+# For 2^k - 1 bulbs, the patterns are the S-matrix itself (every pattern perturbs (n_bulbs + 1) / 2 bulbs).
+def get_hadamard_patterns(n_bulbs):
+	H = np.ones((1, 1))
+	while H.shape[0] <= n_bulbs:
+		H = np.vstack([np.hstack([H, H]), np.hstack([H, -H])])
+	patterns = []
+	for row in ((1 - H[1:, 1:]) / 2)[:, :n_bulbs]:
+		if np.linalg.matrix_rank(np.array(patterns + [row])) > len(patterns):
+			patterns.append(row)
+		if len(patterns) == n_bulbs:
+			break
+	return np.array(patterns)
+
+
+# Measure illuminance gains matrix A with Hadamard-coded perturbations of all bulbs at once (R - sensor readings before
+# the perturbations). As in the sequential method, bulb j is perturbed by -S_j, where S_j = step if its dimming level is
+# above the pivot B, and -step otherwise. Every repeat measures all patterns (and the unperturbed readings, if it's not
+# the first one). Then unperturbed readings and A are fitted to all measurements (R = R_0 + A (d - d_0), where d are the
+# dimming levels realized by the bulbs) by least squares.
+# Returns (A, RMS residual of the fit), residual is None if the fit is not overdetermined (a single repeat: the
+# measurements are fitted exactly).
+def measure_gains_hadamard(sensors, actuators, dim_levels, R, step, B, wait_time, n_repeats=1, settle_detector=None):
+	dim_levels = np.array(dim_levels)
+	S = np.where(dim_levels > B, step, -step)
+	patterns = get_hadamard_patterns(len(dim_levels))
+	D = [dim_levels]
+	R_measured = [R]
+	for repeat in range(n_repeats):
+		if repeat > 0:
+			actuators.set_dimming(dim_levels.tolist(), wait_time, settle_detector)
+			R_prime, _ = sensors.get_sensor_readings()
+			D.append(np.array(actuators.get_dim_levels()[:len(dim_levels)]))
+			R_measured.append(R_prime)
+		for k, pattern in enumerate(patterns):
+			print "\n", "-"*40, "\nPATTERN {} (repeat {}): {}".format(k, repeat, pattern.astype(int))
+			actuators.set_dimming((dim_levels - pattern * S).tolist(), wait_time, settle_detector)
+			R_prime, _ = sensors.get_sensor_readings()
+			print " => R_prime:", R_prime
+			print_settle_time(settle_detector)
+			D.append(np.array(actuators.get_dim_levels()[:len(dim_levels)]))
+			R_measured.append(R_prime)
+	actuators.set_dimming(dim_levels.tolist(), 0)  # Wait time is 0 since we don't measure illuminance after this step.
+
+	X = np.hstack([np.ones((len(D), 1)), np.array(D) - dim_levels])
+	R_measured = np.array(R_measured)
+	coef, _, _, _ = np.linalg.lstsq(X, R_measured, rcond=None)
+	fit_residual = None
+	if X.shape[0] > X.shape[1]:
+		fit_residual = math.sqrt(np.mean((R_measured - X.dot(coef)) ** 2))
+	# Gains are nonnegative (negative estimates are caused by sensor noise).
+	A = np.clip(coef[1:].T, 0, None)
+	return A, fit_residual
+
+
+# Print how long the last wait for sensor readings to settle took.
+def print_settle_time(settle_detector):
+	if settle_detector:
+		print " => Settle time: {:.0f} ms".format(settle_detector.last_wait_time * 1000)
+
+
 # Get configs for sensing modules from the SENS_MODULE_CONFIG_FILE_NAME file.
 def get_sens_module_config():
 	address_list = []
@@ -113,6 +342,13 @@ def get_sens_module_config():
 if __name__ == '__main__':
 	parser = argparse.ArgumentParser(description='Calibration parameters')
 	parser.add_argument('-i', '--initial_calibration', action='store_true')
+	parser.add_argument('-m', '--method', choices=[SEQUENTIAL_CALIBRATION, HADAMARD_CALIBRATION],
+	                    default=SEQUENTIAL_CALIBRATION)
+	parser.add_argument('-r', '--repeats', type=int, default=1, help='Number of repeats (Hadamard method only)')
+	parser.add_argument('-c', '--compare', action='store_true',
+	                    help='Compare the Hadamard method with the sequential one')
+	parser.add_argument('-f', '--fixed_wait', action='store_true',
+	                    help='Wait for a fixed time after every change of dimming levels (no settle detection)')
 	args = parser.parse_args()
 	addresses, light_calibration_const = get_sens_module_config()
 	office_sensing = OfficeSensing(addresses, light_calibration_const)
@@ -121,7 +357,8 @@ if __name__ == '__main__':
 	# Calibrate
 	try:
 		calibrate(office_sensing, ceiling_actuation, step=0.35, B=0.65,
-		          wait_time=2, initial_calibration=args.initial_calibration)
+		          wait_time=2, initial_calibration=args.initial_calibration, method=args.method, n_repeats=args.repeats,
+		          compare_with_sequential=args.compare, settle_detection=not args.fixed_wait)
 	except KeyboardInterrupt:
 		print "\nScript Interrupted"
 		office_sensing.stop_sens_modules()
@@ -129,3 +366,4 @@ if __name__ == '__main__':
 		office_sensing.stop_sens_modules()
 		print "Error Message:\n", str(e)
 	office_sensing.stop_sens_modules()
+	ceiling_actuation.close()
@@ -0,0 +1,81 @@
+"""
+File name: benchmark_dimming_lp.py
+Author: Yerbol Aussat
+Python Version: 2.7
+
+Benchmark of the optimal dimming linear program. Environmental illuminance drifts by sensor noise between consecutive
+solves (as in the optimizer loop of rpi_optimize.py), and the script reports solve times of:
+- DimmingLP, warm-started from the previous solve;
+- DimmingLP, solved from scratch;
+- scipy.optimize.linprog (interior-point method), which was used by the optimizer before DimmingLP.
+It also reports the time of importing scipy.optimize (DimmingLP only depends on NumPy).
+If illuminance gains matrix A was saved by calibration (illum_gain.npy), it's used; otherwise A is random.
+"""
+
+import time
+import sys
+import os
+import inspect
+import numpy as np
+currentdir = os.path.dirname(os.path.abspath(inspect.getfile(inspect.currentframe())))
+parentdir = os.path.dirname(currentdir)
+sys.path.insert(0, parentdir)
+from dimming_lp import DimmingLP
+from rpi_optimize import BEST_FIT_COEF_1
+
+# Constants
+N_SOLVES = 1000
+ENV_NOISE = 5.0  # Standard deviation of the environmental illuminance drift between solves (lux).
+ILLUM_GAIN_MTX_FILE_NAME = os.path.join(parentdir, 'illum_gain.npy')
+
+
+# Print statistics of solve times (in seconds).
+def print_times(name, solve_times):
+	solve_times = np.array(solve_times) * 1000
+	print "{:<28} {:>10.3f} {:>10.3f} {:>10.3f}".format(
+		name, solve_times.mean(), np.median(solve_times), solve_times.max())
+
+
+if __name__ == '__main__':
+	start = time.time()
+	from scipy.optimize import linprog
+	scipy_import_time = time.time() - start
+
+	if os.path.isfile(ILLUM_GAIN_MTX_FILE_NAME):
+		A = np.load(ILLUM_GAIN_MTX_FILE_NAME)
+	else:
+		A = np.random.rand(4, 8) * 300
+	n_sensors, n_bulbs = A.shape
+	c = [BEST_FIT_COEF_1] * n_bulbs
+	bounds = [(0.0, 1.0) for _ in range(n_bulbs)]
+	target_illum = np.array([450] * n_sensors)
+
+	dimming_lp = DimmingLP(A, c, bounds)
+	E = np.random.rand(n_sensors) * 100
+	warm_times, cold_times, linprog_times = [], [], []
+	n_pivots = 0
+	max_error = 0
+	for _ in range(N_SOLVES):
+		E = np.clip(E + np.random.randn(n_sensors) * ENV_NOISE, 0, 400)
+		target_no_env = target_illum - E
+
+		res = dimming_lp.solve(target_no_env)
+		warm_times.append(res.solve_time)
+		n_pivots += res.nit
+		cold_times.append(DimmingLP(A, c, bounds).solve(target_no_env).solve_time)
+
+		start = time.time()
+		res_linprog = linprog(c, A_ub=np.negative(A), b_ub=np.negative(target_no_env), bounds=bounds,
+		                      method='interior-point', options={"disp": False})
+		linprog_times.append(time.time() - start)
+		if res.success and res_linprog.success:
+			max_error = max(max_error, abs(res.fun - res_linprog.fun))
+
+	print "{} solves, {} sensors, {} bulbs\n".format(N_SOLVES, n_sensors, n_bulbs)
+	print "{:<28} {:>10} {:>10} {:>10}".format("Solve time (ms)", "Mean", "Median", "Max")
+	print_times("DimmingLP (warm start)", warm_times)
+	print_times("DimmingLP (cold start)", cold_times)
+	print_times("linprog (interior-point)", linprog_times)
+	print "\nImport of scipy.optimize: {:.1f} ms".format(scipy_import_time * 1000)
+	print "Mean dual simplex pivots per warm solve: {:.3f}".format(float(n_pivots) / N_SOLVES)
+	print "Max difference of optimal power from linprog: {:.2e} W".format(max_error)
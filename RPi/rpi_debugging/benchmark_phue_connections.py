@@ -0,0 +1,108 @@
+"""
+File name: benchmark_phue_connections.py
+Author: Yerbol Aussat
+Python Version: 2.7
+
+Benchmark of requests to a Philips Hue bridge: persistent (keep-alive) connections from the connection pool of
+phue.Bridge vs. a new connection per request (how phue.Bridge.request worked before). A local fake bridge (HTTP/1.1
+server that replies to every request with a Hue-style success message) is used, so the numbers show the overhead of
+opening connections, rather than the latency of the bridge. As in CeilingActuation.set_dimming, N_THREADS threads send
+"set state" requests concurrently.
+"""
+
+import json
+import time
+import sys
+import os
+import inspect
+import httplib
+import BaseHTTPServer
+import SocketServer
+from threading import Thread
+currentdir = os.path.dirname(os.path.abspath(inspect.getfile(inspect.currentframe())))
+parentdir = os.path.dirname(currentdir)
+sys.path.insert(0, parentdir)
+from phue import Bridge
+
+# Constants
+FAKE_BRIDGE_ADDRESS = ('127.0.0.1', 8080)
+USERNAME = 'benchmark'
+N_THREADS = 8
+N_REQUESTS_PER_THREAD = 250
+
+
+# Fake bridge: replies to every request over keep-alive connections.
+class FakeBridgeHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+	protocol_version = 'HTTP/1.1'
+	wbufsize = -1  # Send a response in one segment (it's flushed after every request).
+
+	def do_PUT(self):
+		self.rfile.read(int(self.headers.getheader('Content-Length', 0)))
+		response = json.dumps([{"success": {self.path: True}}])
+		self.send_response(200)
+		self.send_header('Content-Type', 'application/json')
+		self.send_header('Content-Length', str(len(response)))
+		self.end_headers()
+		self.wfile.write(response)
+
+	def log_message(self, *args):
+		pass
+
+
+class FakeBridge(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+	daemon_threads = True
+	request_queue_size = 64
+
+
+# Send a request over a new connection (as phue.Bridge.request did before the connection pool was added).
+def request_new_connection(bridge, mode, address, data):
+	connection = httplib.HTTPConnection(bridge.ip, timeout=10)
+	connection.request(mode, address, json.dumps(data))
+	response = connection.getresponse().read()
+	connection.close()
+	return json.loads(response)
+
+
+# Send requests from N_THREADS threads concurrently, using request_fn. Returns (total time, list of request latencies).
+def run_benchmark(bridge, request_fn):
+	latencies = [[] for _ in range(N_THREADS)]
+
+	def send_requests(thread_id):
+		address = '/api/{}/lights/{}/state'.format(USERNAME, thread_id + 1)
+		for i in range(N_REQUESTS_PER_THREAD):
+			start = time.time()
+			request_fn(bridge, 'PUT', address, {'bri': i % 255})
+			latencies[thread_id].append(time.time() - start)
+
+	start = time.time()
+	thread_list = [Thread(target=send_requests, args=(i, )) for i in range(N_THREADS)]
+	for thread in thread_list:
+		thread.start()
+	for thread in thread_list:
+		thread.join()
+	return time.time() - start, sum(latencies, [])
+
+
+# Print results of a benchmark.
+def print_results(name, total_time, latencies):
+	latencies = sorted(latencies)
+	print "{:<28} {:>12.1f} {:>12.3f} {:>12.3f}".format(
+		name, len(latencies) / total_time, 1000 * sum(latencies) / len(latencies),
+		1000 * latencies[int(0.99 * len(latencies))])
+
+
+if __name__ == '__main__':
+	server = FakeBridge(FAKE_BRIDGE_ADDRESS, FakeBridgeHandler)
+	server_thread = Thread(target=server.serve_forever)
+	server_thread.daemon = True
+	server_thread.start()
+
+	bridge = Bridge('{}:{}'.format(*FAKE_BRIDGE_ADDRESS), USERNAME)
+	print "{} threads x {} requests\n".format(N_THREADS, N_REQUESTS_PER_THREAD)
+	print "{:<28} {:>12} {:>12} {:>12}".format("", "Requests/s", "Mean (ms)", "p99 (ms)")
+	new_connection_results = run_benchmark(bridge, request_new_connection)
+	pool_results = run_benchmark(bridge, lambda bridge, mode, address, data: bridge.request(mode, address, data))
+	print_results("New connection per request", *new_connection_results)
+	print_results("Connection pool", *pool_results)
+	bridge.close_connections()
+	server.shutdown()
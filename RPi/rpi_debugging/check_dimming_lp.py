@@ -0,0 +1,94 @@
+"""
+File name: check_dimming_lp.py
+Author: Yerbol Aussat
+Python Version: 2.7
+
+Script to check that DimmingLP gives the same results as scipy.optimize.linprog. It generates random problems (random
+illuminance gains matrices A, with some zero gains and duplicate sensors, random costs, targets and environmental
+illuminance), solves each problem for a sequence of drifting environmental illuminance values (so that warm starts are
+checked too), and compares the status (optimal or infeasible) and the optimal value with linprog's ones. Solutions of
+linprog's interior-point method are approximate, so an optimal value of DimmingLP is accepted if it's not larger than
+linprog's one (within tolerance), and its solution satisfies the constraints.
+Usage: python check_dimming_lp.py [number of problems] [random seed]
+"""
+
+import sys
+import os
+import inspect
+import numpy as np
+from scipy.optimize import linprog
+currentdir = os.path.dirname(os.path.abspath(inspect.getfile(inspect.currentframe())))
+parentdir = os.path.dirname(currentdir)
+sys.path.insert(0, parentdir)
+from dimming_lp import DimmingLP
+
+# Constants
+N_PROBLEMS = 1000
+N_SOLVES_PER_PROBLEM = 10
+MAX_SENSORS = 16
+MAX_BULBS = 8
+TOL = 1e-6  # Relative tolerance.
+
+
+# Generate a random problem: (A, c, bounds, t_0), where t_0 is the target illuminance.
+def random_problem(rand):
+	n_sensors = rand.randint(1, MAX_SENSORS + 1)
+	n_bulbs = rand.randint(1, MAX_BULBS + 1)
+	A = rand.rand(n_sensors, n_bulbs) * 300
+	A[rand.rand(n_sensors, n_bulbs) < 0.3] = 0  # Bulbs that don't light some sensors.
+	if n_sensors > 1 and rand.rand() < 0.2:
+		A[-1] = A[0]  # Two sensors with the same gains (degenerate problem).
+	if rand.rand() < 0.5:
+		c = [rand.rand() * 20] * n_bulbs  # Uniform cost, as in rpi_optimize.py.
+	else:
+		c = (rand.rand(n_bulbs) * 20).tolist()
+	bounds = [(0.0, 1.0) for _ in range(n_bulbs)]
+	# Targets of occupied desks are up to 110% of the illuminance that all bulbs give together (so some problems are
+	# infeasible).
+	target_illum = rand.choice([0, 1], n_sensors) * rand.uniform(0.2, 1.1, n_sensors) * A.sum(axis=1)
+	return A, c, bounds, target_illum
+
+
+# Check that DimmingLP's result res agrees with linprog for the problem. Returns an error message (None if they agree).
+def compare(A, c, bounds, t, res):
+	try:
+		ref = linprog(c, A_ub=np.negative(A), b_ub=np.negative(t), bounds=bounds, method='interior-point',
+		              options={"disp": False})
+	except ValueError:
+		return None  # linprog's solution failed its own consistency checks.
+	if ref.status not in [0, 2]:
+		return None  # linprog didn't converge, so there's nothing to compare with.
+	if res.status != ref.status:
+		return "status {}, linprog status {}".format(res.status, ref.status)
+	if res.success:
+		if res.fun - ref.fun > TOL * max(1.0, abs(ref.fun)):
+			return "optimal value {}, linprog optimal value {}".format(res.fun, ref.fun)
+		if (A.dot(res.x) < t - TOL * max(1.0, np.abs(t).max())).any():
+			return "illuminance constraints are violated"
+	return None
+
+
+if __name__ == '__main__':
+	n_problems = int(sys.argv[1]) if len(sys.argv) > 1 else N_PROBLEMS
+	seed = int(sys.argv[2]) if len(sys.argv) > 2 else 0
+	rand = np.random.RandomState(seed)
+
+	n_mismatches = 0
+	n_infeasible = 0
+	for i in range(n_problems):
+		A, c, bounds, target_illum = random_problem(rand)
+		dimming_lp = DimmingLP(A, c, bounds)
+		E = rand.rand(len(target_illum)) * 100
+		for _ in range(N_SOLVES_PER_PROBLEM):
+			E = E + rand.randn(len(E)) * 5
+			t = target_illum - E
+			res = dimming_lp.solve(t)
+			n_infeasible += res.status == 2
+			error_msg = compare(A, c, bounds, t, res)
+			if error_msg:
+				n_mismatches += 1
+				print "Problem {} ({} warm start): {}".format(i, "with" if res.warm_start else "without", error_msg)
+
+	print "\n{} problems, {} solves ({} infeasible), {} mismatches".format(
+		n_problems, n_problems * N_SOLVES_PER_PROBLEM, n_infeasible, n_mismatches)
+	sys.exit(1 if n_mismatches else 0)
@@ -0,0 +1,97 @@
+"""
+File name: check_model_validation.py
+Author: Yerbol Aussat
+Python Version: 2.7
+
+Script to check validation of the stored illuminance gains matrix A (see validate_model in rpi_calibrate.py) on
+simulated sensors and bulbs: readings are E + A_true d plus noise, where d are the dimming levels realized by the bulbs.
+Validation must pass if A is accurate, and fail if a single column of A is wrong (the bulb is dead), for every bulb.
+A dead bulb whose gains are small at every sensor may pass, since its contribution is within the tolerance, so wrong
+columns may be accepted in at most MAX_ACCEPTED_FRACTION of trials (a pattern that doesn't perturb the bulb accepts
+them in all trials).
+Usage: python check_model_validation.py [number of trials] [random seed]
+"""
+
+import sys
+import os
+import inspect
+import numpy as np
+currentdir = os.path.dirname(os.path.abspath(inspect.getfile(inspect.currentframe())))
+parentdir = os.path.dirname(currentdir)
+sys.path.insert(0, parentdir)
+from rpi_calibrate import validate_model, get_validation_patterns
+from dimming_conversion import MAX_BRIGHTNESS
+
+# Constants
+N_TRIALS = 100
+N_SENSORS = 5
+N_BULBS = 8
+NOISE = 2.0  # Standard deviation of sensor noise (lux).
+STEP = 0.35
+B = 0.65
+MAX_ACCEPTED_FRACTION = 0.05
+
+
+# Simulated bulbs (dimming levels are quantized to brightness codes).
+class SimulatedActuation:
+	def __init__(self, n_bulbs):
+		self.d = np.full(n_bulbs, 0.8)
+
+	def set_dimming(self, desired_dimming, wait_time=0, settle_detector=None):
+		self.d = np.clip(np.round(np.array(desired_dimming, dtype=float) * MAX_BRIGHTNESS) / MAX_BRIGHTNESS, 0, 1)
+
+	def get_dim_levels(self):
+		return self.d.tolist()
+
+
+# Simulated sensing modules.
+class SimulatedSensing:
+	def __init__(self, A_true, E, actuators, rand):
+		self.A_true = A_true
+		self.E = E
+		self.actuators = actuators
+		self.rand = rand
+
+	def get_sensor_readings(self):
+		R = self.E + self.A_true.dot(self.actuators.d) + self.rand.randn(len(self.E)) * NOISE
+		return R.tolist(), [0] * len(self.E)
+
+
+# Validate stored matrix A, when the real gains are A_true.
+def validate(A, A_true, rand):
+	actuators = SimulatedActuation(A.shape[1])
+	sensors = SimulatedSensing(A_true, rand.uniform(0, 100, A.shape[0]), actuators, rand)
+	R, _ = sensors.get_sensor_readings()
+	stdout = sys.stdout
+	sys.stdout = open(os.devnull, 'w')  # validate_model prints every pattern.
+	try:
+		return validate_model(sensors, actuators, A, np.array(actuators.d), R, STEP, B, 0)
+	finally:
+		sys.stdout.close()
+		sys.stdout = stdout
+
+
+if __name__ == '__main__':
+	n_trials = int(sys.argv[1]) if len(sys.argv) > 1 else N_TRIALS
+	seed = int(sys.argv[2]) if len(sys.argv) > 2 else 0
+	rand = np.random.RandomState(seed)
+	n_errors = 0
+
+	for n_bulbs in range(1, N_BULBS + 1):
+		if not get_validation_patterns(n_bulbs).any(axis=0).all():
+			n_errors += 1
+			print "Validation patterns for {} bulbs don't perturb every bulb".format(n_bulbs)
+
+	n_rejected = 0
+	n_accepted = np.zeros(N_BULBS, dtype=int)  # Number of trials where a wrong column j passed validation.
+	for _ in range(n_trials):
+		A = rand.uniform(50, 200, (N_SENSORS, N_BULBS))
+		n_rejected += not validate(A, A, rand)
+		for j in range(N_BULBS):
+			A_true = A.copy()
+			A_true[:, j] = 0  # Bulb j is dead.
+			n_accepted[j] += validate(A, A_true, rand)
+	print "Accurate A rejected in {} of {} trials".format(n_rejected, n_trials)
+	print "A with a wrong column accepted (per column): {}".format(n_accepted.tolist())
+	n_errors += n_rejected + (n_accepted > MAX_ACCEPTED_FRACTION * n_trials).sum()
+	sys.exit(1 if n_errors else 0)
@@ -0,0 +1,127 @@
+"""
+File name: check_settle_detection.py
+Author: Yerbol Aussat
+Python Version: 2.7
+
+Script to check that SettleDetector doesn't report illuminance as settled while bulbs are still being dimmed. Sensor is
+simulated as TSL2561 sees light: every reading is the mean illuminance over an integration period, it's repeated until
+the next integration period ends (a staircase), and it reaches the detector through periodic stages (light sampling
+thread of the sensing module, push frames, and state bus updates, 0.1 s each), each of which passes on the latest value
+it has. Illuminance ramps linearly from one level to another (Philips Hue transition). Phases of the integration and
+the stages, and levels are random. Waits run on a simulated clock.
+A wait fails if it returns True while the reading is not within the tolerance of the final illuminance.
+Trials are run for sensing modules with 101 ms integration (and the default detector), for the 402 ms integration
+(with the detector set up for it), and for the 402 ms integration with a 0.3 s window (for comparison: it sees only
+repeated readings, and fails).
+Usage: python check_settle_detection.py [number of trials] [random seed]
+"""
+
+import sys
+import os
+import inspect
+import numpy as np
+currentdir = os.path.dirname(os.path.abspath(inspect.getfile(inspect.currentframe())))
+parentdir = os.path.dirname(currentdir)
+sys.path.insert(0, parentdir)
+import settle_detection
+from settle_detection import SettleDetector
+
+# Constants
+N_TRIALS = 1000
+MEDIUM_INTEGRATION_TIME = 0.101  # seconds
+SLOW_INTEGRATION_TIME = 0.402  # seconds
+STAGE_PERIODS = [0.1, 0.1, 0.1]  # Light sampling thread, push frames, state bus updates (s).
+TRANSITION_DELAY = 0.05  # Time until bulbs start changing (s).
+TRANSITION_TIME = 0.4  # seconds
+NOISE = 1.0  # Standard deviation of sensor noise (lux).
+MAX_WAIT = 4.0  # seconds
+# Max difference between the reading and the final illuminance when the wait ends: the larger of the absolute tolerance
+# and the relative one, times the final illuminance (steps that are close to the tolerance of the detector can't be told
+# apart from noise).
+TOLERANCE = 10.0  # lux
+RELATIVE_TOLERANCE = 0.05
+
+
+# Simulated clock (replaces the time module in settle_detection).
+class Clock:
+	def __init__(self):
+		self.now = 0.0
+
+	def time(self):
+		return self.now
+
+	def sleep(self, seconds):
+		self.now += seconds
+
+
+# Simulated light sensor, for illuminance that ramps from illum_start to illum_end (dimming starts at time 0).
+class StaircaseSensor:
+	def __init__(self, clock, illum_start, illum_end, integration_time, rand):
+		self.clock = clock
+		self.illum_start = illum_start
+		self.illum_end = illum_end
+		self.integration_time = integration_time
+		self.rand = rand
+		self.phase = rand.uniform(0, integration_time)  # End of the first integration period after time 0.
+		self.stages = [(period, rand.uniform(0, period)) for period in STAGE_PERIODS]  # (period, phase)
+		self.frames = {}  # Integration period index -> reading.
+
+	# Illuminance at time t.
+	def get_illuminance(self, t):
+		progress = np.clip((t - TRANSITION_DELAY) / TRANSITION_TIME, 0, 1)
+		return self.illum_start + progress * (self.illum_end - self.illum_start)
+
+	# Reading of the integration period that ends at phase + k * integration_time.
+	def get_frame(self, k):
+		if k not in self.frames:
+			end = self.phase + k * self.integration_time
+			t = np.linspace(end - self.integration_time, end, 50)
+			self.frames[k] = np.mean(self.get_illuminance(t)) + self.rand.randn() * NOISE
+		return self.frames[k]
+
+	# Latest reading that reached the detector: every stage passes on the value it had at its last update.
+	def read(self):
+		t = self.clock.now
+		for period, phase in reversed(self.stages):
+			t = phase + np.floor((t - phase) / period) * period
+		return [self.get_frame(int(np.floor((t - self.phase) / self.integration_time)))]
+
+
+# Run trials with a sensor that has the given integration time, and a detector that has the given parameters.
+# Returns (number of failures, mean wait time, 95th percentile of wait time).
+def run_trials(n_trials, rand, integration_time, **detector_params):
+	clock = Clock()
+	settle_detection.time = clock
+	n_failures = 0
+	wait_times = []
+	for _ in range(n_trials):
+		clock.now = 0.0
+		illum_start, illum_end = rand.uniform(50, 700, 2)
+		sensor = StaircaseSensor(clock, illum_start, illum_end, integration_time, rand)
+		settle_detector = SettleDetector(sensor.read, **detector_params)
+		settled = settle_detector.wait(MAX_WAIT)
+		wait_times.append(settle_detector.last_wait_time)
+		if settled and abs(sensor.read()[0] - illum_end) > max(TOLERANCE, RELATIVE_TOLERANCE * illum_end):
+			n_failures += 1
+	return n_failures, np.mean(wait_times), np.percentile(wait_times, 95)
+
+
+# Print results of trials.
+def print_results(label, n_trials, n_failures, mean_wait, wait_95):
+	print "{:<45} {} failures in {} trials, mean wait {:.2f} s, 95th percentile {:.2f} s".format(
+		label + ":", n_failures, n_trials, mean_wait, wait_95)
+
+
+if __name__ == '__main__':
+	n_trials = int(sys.argv[1]) if len(sys.argv) > 1 else N_TRIALS
+	seed = int(sys.argv[2]) if len(sys.argv) > 2 else 0
+
+	medium_results = run_trials(n_trials, np.random.RandomState(seed), MEDIUM_INTEGRATION_TIME)
+	print_results("101 ms integration, default detector", n_trials, *medium_results)
+	slow_results = run_trials(n_trials, np.random.RandomState(seed), SLOW_INTEGRATION_TIME,
+	                          sensor_period=SLOW_INTEGRATION_TIME)
+	print_results("402 ms integration", n_trials, *slow_results)
+	short_results = run_trials(n_trials, np.random.RandomState(seed), SLOW_INTEGRATION_TIME, window=0.3,
+	                           min_wait=0.4, sensor_period=0, sensor_delay=0)
+	print_results("402 ms integration, 0.3 s window", n_trials, *short_results)
+	sys.exit(1 if medium_results[0] or slow_results[0] else 0)
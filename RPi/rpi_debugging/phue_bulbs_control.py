@@ -6,10 +6,19 @@ Python Version: 2.7
 Script for testing Philips Hue bulbs
 """
 
+import sys
+import os
+import inspect
+currentdir = os.path.dirname(os.path.abspath(inspect.getfile(inspect.currentframe())))
+parentdir = os.path.dirname(currentdir)
+sys.path.insert(0, parentdir)
 from phue import Bridge
+from dimming_conversion import DimmingConversion
 
 # Constants
 PHUE_IP_ADDRESS = '192.168.0.2'
+# [Dimming level -> control value] conversion of the tested bulbs.
+DIM_CONVERSION = DimmingConversion(a_dim=1.74069750372e-05, m_dim=1.97866862723, b_dim=0.00279331968066)
 
 
 # Turn the bulb on, and set brightness to max
@@ -34,18 +43,7 @@ def set_brightness(bulb_id, bright_value):
 
 # Get phue control value for dimming level d
 def get_contr(d): 
-	a_dim = 1.74069750372e-05
-	m_dim = 1.97866862723
-	b_dim = 0.00279331968066
-	if d == -1:
-		return -1
-	elif d <= b_dim:
-		return 0
-	elif d > 1:
-		return 255
-	
-	contr = ((d-b_dim) / a_dim) ** (1.0/m_dim)
-	return contr
+	return DIM_CONVERSION.dim_to_contr(d)
 
 
 def test_binary():
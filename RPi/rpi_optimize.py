@@ -6,24 +6,42 @@ Python Version: 2.7
 This process calculates optimal dimming levels of Philips Hue bulbs (given occupancy and illuminance values), and
 sets them on the bulbs. It also listens for commands from rpi_sense process.
 
+The optimizer is a long-lived worker: when occupancy changes, rpi_sense sends it new targets, which replace the current
+ones in place, and the next optimization step starts right away (instead of restarting the optimizer in a new process).
+The optimizer can also be paused (e.g., while a portable sensing module is integrated or disconnected); it's resumed by
+the next targets, which rpi_sense sends when the occupancy vector changes with the set of sensing modules (so they
+match the updated model). Reaction latency (time from a command being sent to new dimming levels being set) is
+reported after every command.
+
+Illuminance gains matrix A is refined online (see gain_estimator.py) from the dimming levels and sensor readings of the
+optimizer loop: only when illuminance settled after the previous optimization step (see settle_detection.py), so that
+readings reflect the dimming levels that were set (A isn't refined if SETTLE_DETECTION is off). The refined A is
+published (and the dimming policy is set up again) only when it differs from the current one by more than
+MODEL_UPDATE_THRESHOLD. When A is changed by another process (e.g., by calibration), the estimator starts over from it.
+
 TODO:
-- In the current implementation, occupancy vector from "cur_occup.txt" contains occupancy values (0, 1) for "per-desk"
+- In the current implementation, occupancy vector in the state bus contains occupancy values (0, 1) for "per-desk"
 sensing modules, and target illuminances (lux) for portable sensing modules, which is confusing. This should be fixed
 to make the code more readable.
 """
 
 from datetime import datetime as dt
-import os
+import time
 import numpy as np
 import traceback
-from scipy.optimize import linprog
+import itertools
+from dimming_lp import DimmingLP
+from dimming_policy import DimmingPolicy
+from dimming_cache import DimmingCache
+from gain_estimator import GainEstimator
+from settle_detection import SettleDetector
 from ceiling_actuation import CeilingActuation
 from multiprocessing.connection import Listener
-from multiprocessing import Process
-from multiprocessing import Lock
-from rpi_sense import OCCUPANCY_FILE_NAME
-from rpi_sense import ILLUMINANCE_FILE_NAME
 from rpi_calibrate import PHUE_IP_ADDRESS
+from rpi_sense import OPTIMIZE_COMMAND
+from rpi_sense import PAUSE_OPTIMIZATION_COMMAND
+from rpi_sense import CLOSE_CONNECTION_COMMAND
+from state_bus import StateBus
 
 print "{:<35} {:<25}".format("Finished importing libraries.", dt.now().strftime("%H:%M:%S.%f"))
 
@@ -34,32 +52,65 @@ BEST_FIT_COEF_2 = 1.1814
 
 ILLUM_GAIN_MTX_FILE_NAME = 'illum_gain.npy'
 ENV_GAIN_FILE_NAME = 'env_gain.npy'
-lock = Lock()
+COMPARE_WITH_LINPROG = False  # Whether to also time a cold scipy.optimize.linprog solve on every optimization step.
+OPTIMIZATION_PERIOD = 1.5  # Max seconds between optimization steps (bulbs are dimmed and illuminance settles meanwhile)
+SETTLE_DETECTION = True  # Whether the next optimization step starts as soon as illuminance settles.
+N_PER_DESK_MODULES = 4  # Number of "per-desk" sensing modules (they come first in the occupancy vector).
+OCCUPIED_DESK_TARGET_ILLUM = 450  # lux
+POLICY_N_ENV_SAMPLES = 50  # Number of samples of E per occupancy pattern, for which the dimming policy is precomputed.
+POLICY_MAX_ENV_ILLUM = 500  # Samples of E are in [0, POLICY_MAX_ENV_ILLUM] lux, or close to the current E.
+POLICY_ENV_NOISE = 20.0  # Standard deviation of samples of E that are close to the current E (lux).
+CACHE_QUANTIZATION_STEP = 2.0  # Quantization step of E in keys of the cache of solutions (lux).
+CACHE_CAPACITY = 1024  # Number of solutions in the cache.
+ONLINE_GAIN_ESTIMATION = True  # Whether to refine matrix A online.
+MODEL_UPDATE_THRESHOLD = 0.02  # Min relative change (Frobenius norm) of the refined A, for it to be published.
+
+
+# Explicit dimming policy (with the linear program for optimal dimming, which is used when the policy doesn't cover the
+# current E), and (version of matrix A, number of bulbs) that it was set up for.
+dimming_policy = None
+dimming_policy_key = None
+# Cache of solutions, keyed on (target illuminance, quantized E). It is cleared when the dimming policy is set up again.
+dimming_cache = DimmingCache(CACHE_QUANTIZATION_STEP, CACHE_CAPACITY)
+# Online estimator of matrix A, and version of A in the state bus that it is based on.
+gain_estimator = None
+gain_estimator_version = None
 
 
 # Get target illuminance based on occupancy
-def get_target_illum():	
-	with open(OCCUPANCY_FILE_NAME, 'r') as f_occup:
-		occupancy_vals_str = f_occup.read()
-	occupancy_vals = [int(val) for val in occupancy_vals_str.split()]
-	return np.array([450 if occupancy_vals[i] == 1 else occupancy_vals[i] for i in range(len(occupancy_vals))])
+def get_target_illum(occupancy_vals):
+	return np.array([OCCUPIED_DESK_TARGET_ILLUM if occupancy_vals[i] == 1 else occupancy_vals[i]
+	                 for i in range(len(occupancy_vals))])
+
+
+# Set up the linear program for optimal dimming, and precompute the explicit dimming policy for all occupancy patterns of
+# "per-desk" sensing modules (target illuminances of portable sensing modules are the current ones), for samples of E
+# that are spread over the range of environmental illuminance, or close to the current E.
+def build_dimming_policy(A, c, bounds, target_illum, E):
+	start = time.time()
+	policy = DimmingPolicy(DimmingLP(A, c, bounds))
+	n_desks = min(N_PER_DESK_MODULES, len(target_illum))
+	target_illums = []
+	for desk_targets in itertools.product([0, OCCUPIED_DESK_TARGET_ILLUM], repeat=n_desks):
+		target_illums.append(np.concatenate((desk_targets, target_illum[n_desks:])))
+	env_gains = [np.random.rand(len(E)) * POLICY_MAX_ENV_ILLUM for _ in range(POLICY_N_ENV_SAMPLES / 2)]
+	env_gains += [E + np.random.randn(len(E)) * POLICY_ENV_NOISE for _ in range(POLICY_N_ENV_SAMPLES / 2)]
+	policy.precompute(target_illums, env_gains)
+	print "{:<35} {} regions, {:.1f} ms".format(
+		"Dimming policy precomputed:", policy.get_n_regions(), (time.time() - start) * 1000)
+	return policy
 
 
 # Set optimal dimming value that satisfies target illuminance.
-# cur_dim_level.txt file gets updated in actuators.set_dimming method.
-def set_optimal_dimming(actuators, target_illum, wait_time=1.0):
-	# Take negative of values so we can represent constraints as required by scipy.optimize.linprog
-	if not os.path.isfile('./{}'.format(ILLUM_GAIN_MTX_FILE_NAME)) or \
-			not os.path.isfile('./{}'.format(ENV_GAIN_FILE_NAME)):
-		return
-	A = np.load(ILLUM_GAIN_MTX_FILE_NAME)
-	A = np.negative(A)
-	try:
-		E = np.load(ENV_GAIN_FILE_NAME)
-	except IOError, e:
-		log_error(str(e))
-		return
-	print "\n{:<35} {:<25}".format("I/O operations finished.", dt.now().strftime("%H:%M:%S.%f"))
+# Dimming levels in the state bus get updated in actuators.set_dimming method.
+# Returns True if dimming levels were set (False if there is no illuminance model in the state bus yet).
+def set_optimal_dimming(actuators, state_bus, target_illum, wait_time=1.0):
+	global dimming_policy, dimming_policy_key
+	illum_gain_version = state_bus.get_illum_gain_version()
+	A, E = state_bus.get_model()
+	if A is None:
+		return False
+	print "\n{:<35} {:<25}".format("State bus read finished.", dt.now().strftime("%H:%M:%S.%f"))
 	# Power consumed by bulb i: Power_i = a_pow * dim_i + b_pow
 	# Coefficients of variable that is being optimized
 	a_pow = BEST_FIT_COEF_1
@@ -68,21 +119,37 @@ def set_optimal_dimming(actuators, target_illum, wait_time=1.0):
 	c = [a_pow] * n_bulbs
 	
 	# Target for each sensor
-	# Offsetting target by environmental contribution (Again, to get the form required by scipy.optimize.linprog)
-	target_no_env = [target_illum[i] - E[i] for i in range(len(E))]
-	target_no_env = np.negative(target_no_env)
+	# Offsetting target by environmental contribution
+	target_no_env = np.array([target_illum[i] - E[i] for i in range(len(E))])
 
-	# Solve optimization program
+	# Solve optimization program. The dimming policy (and the linear program) is set up again only when matrix A (or
+	# number of bulbs) changes. The problem is solved for quantized E, so that its solution can be cached.
 	bounds = [(0.0, 1.0) for _ in range(n_bulbs)]
-
-	res = linprog(c, A_ub=A, b_ub=target_no_env, bounds=bounds, method='interior-point',
-	              options={"disp": False})
-
-	# Note: if we use Simplex, tolerance  ("tol") is required.
-	# res = linprog(c, A_ub=A, b_ub=target_no_env, bounds=bounds, method='simplex',
-	#               options={"disp": False, "tol": 1e-11})
+	if dimming_policy_key != (illum_gain_version, n_bulbs):
+		dimming_policy = build_dimming_policy(A, c, bounds, target_illum, E)
+		dimming_policy_key = (illum_gain_version, n_bulbs)
+		dimming_cache.clear()
+	cache_key = dimming_cache.get_key(target_illum, E)
+	res = dimming_cache.get(cache_key)
+	cache_hit = res is not None
+	if not cache_hit:
+		res = dimming_policy.solve(target_illum, dimming_cache.quantize(E))
+		dimming_cache.put(cache_key, res)
 
 	print "{:<35} {:<25}".format("Optimization finished.", dt.now().strftime("%H:%M:%S.%f"))
+	if cache_hit:
+		print "{:<35} cached ({} hits, {} misses)".format("Solve time:", dimming_cache.n_hits, dimming_cache.n_misses)
+	elif dimming_policy.last_hit:
+		print "{:<35} {:.3f} ms (policy region lookup)".format("Solve time:", res.solve_time * 1000)
+	else:
+		print "{:<35} {:.3f} ms (linear program, {} start, {} pivots)".format(
+			"Solve time:", res.solve_time * 1000, "warm" if res.warm_start else "cold", res.nit)
+	if COMPARE_WITH_LINPROG:
+		from scipy.optimize import linprog
+		start = time.time()
+		linprog(c, A_ub=np.negative(A), b_ub=np.negative(target_no_env), bounds=bounds, method='interior-point',
+		        options={"disp": False})
+		print "{:<35} {:.3f} ms".format("Cold interior-point solve time:", (time.time() - start) * 1000)
 
 	if res.success: 
 		d_opt = res.x
@@ -106,34 +173,96 @@ def set_optimal_dimming(actuators, target_illum, wait_time=1.0):
 
 		# power = n_bulbs * (a_pow+b_pow)
 		# print "Optimal power consumption:", "%.3f"%power, "W"
+	return True
+
+
+# Update environmental illuminance gains E, based on current illuminance values and dimming levels (the ones that are
+# realized by bulbs, i.e., quantized to brightness control values).
+# If online gain estimation is on, and illuminance settled (refine_gains is True), matrix A is refined with the same
+# values, and published if it changed enough.
+def update_env_gain(actuators, state_bus, refine_gains=True):
+	global gain_estimator, gain_estimator_version
+	illum_gain_version = state_bus.get_illum_gain_version()
+	A, _ = state_bus.get_model()
+	R = state_bus.get_illuminance()
+	if R is None:
+		raise IOError("Illuminance values are not found")
+	d = actuators.get_dim_levels()
+	if ONLINE_GAIN_ESTIMATION:
+		if gain_estimator is None or illum_gain_version != gain_estimator_version:
+			gain_estimator = GainEstimator(A)
+			gain_estimator_version = illum_gain_version
+		if refine_gains:
+			gain_estimator.update(d, R)
+		if refine_gains and np.linalg.norm(gain_estimator.A - A) > MODEL_UPDATE_THRESHOLD * np.linalg.norm(A):
+			A = gain_estimator.A
+			E = R - A.dot(d)
+			state_bus.set_model(A, E)
+			gain_estimator_version = state_bus.get_illum_gain_version()
+			np.save(ILLUM_GAIN_MTX_FILE_NAME, A)
+			np.save(ENV_GAIN_FILE_NAME, E)
+			print "{:<35} after {} updates".format("Matrix A refined online:", gain_estimator.n_updates)
+			return
+	E = R - A.dot(d)
+	state_bus.set_env_gain(E)
 
 
-# Optimizer thread that sets optimal dimming levels based on current illuminance values.
-def optimizer(actuators):
-	target_illum = get_target_illum()
-	A = np.load(ILLUM_GAIN_MTX_FILE_NAME)
-	R = np.zeros(A.shape[0])
+# Optimizer worker: sets optimal dimming levels when illuminance settles after the previous optimization step (or every
+# OPTIMIZATION_PERIOD seconds, if SETTLE_DETECTION is off, or illuminance doesn't settle), and handles commands from the
+# rpi_sense process in between. Returns when the connection is closed.
+def run_optimizer(conn, actuators, state_bus):
+	target_illum = None
+	running = False
+	command_time = None  # Time when the command that the optimizer hasn't reacted to yet was sent.
+	settle_detector = SettleDetector(state_bus.get_illuminance)
 	while True:
+		# Wait for commands (indefinitely, if the optimizer is paused).
+		dimmed = True  # Whether bulbs had time to be dimmed after the previous optimization step.
+		settled = False  # Whether illuminance settled after the previous optimization step.
+		if running and SETTLE_DETECTION:
+			settled = settle_detector.wait(OPTIMIZATION_PERIOD, stop_fn=conn.poll)
+		if not running or conn.poll(0 if SETTLE_DETECTION else OPTIMIZATION_PERIOD):
+			dimmed = False
+			settled = False
+			# Handle all pending commands, so that only the latest targets are used.
+			while True:
+				command, occupancy, command_time = conn.recv()
+				if command == OPTIMIZE_COMMAND:
+					print "[*] New targets for optimizer"
+					new_target_illum = get_target_illum(occupancy)
+					if target_illum is not None and len(target_illum) == len(new_target_illum):
+						target_illum[:] = new_target_illum
+					else:
+						target_illum = new_target_illum
+					running = True
+				elif command == PAUSE_OPTIMIZATION_COMMAND:
+					print "[*] Pause optimizer"
+					running = False
+				elif command == CLOSE_CONNECTION_COMMAND:
+					conn.close()
+					return
+				if not conn.poll():
+					break
+			if not running:
+				continue
+
 		try:
-			set_optimal_dimming(actuators, target_illum, 1.5)
-			if not os.path.isfile('./{}'.format(ILLUMINANCE_FILE_NAME)):
-				print "Illuminance file is not found"
-				break
-			with open(ILLUMINANCE_FILE_NAME, 'r') as f_illum:
-				cur_illum_str = f_illum.read()
-			if len(cur_illum_str) != 0:
-				R = np.array([float(val) for val in cur_illum_str.split()])
-			d = actuators.get_dim_levels()
-			E = R - A.dot(d)
-			with lock:
-				np.save(ENV_GAIN_FILE_NAME, E)
-		except Exception, e:  # Stop optimizer if there is an error
+			# Environmental illuminance gains are updated only when bulbs had time to be dimmed after the previous
+			# optimization step (and matrix A is refined only if illuminance settled, not on timeouts).
+			if dimmed:
+				update_env_gain(actuators, state_bus, settled)
+			# Reaction latency is reported when dimming levels are set after the command.
+			actuated = set_optimal_dimming(actuators, state_bus, target_illum, wait_time=0)
+			if actuated and command_time is not None:
+				print "{:<35} {:.1f} ms".format("Reaction latency:", (time.time() - command_time) * 1000)
+				command_time = None
+		except Exception, e:  # Pause optimizer if there is an error
 			print "\nOPTIMIZER FAILURE\n"
 			error_msg = str(e)
 			print "Error Message: {}\n".format(error_msg)
 			log_error(error_msg)
 			traceback.print_exc()
-			break
+			running = False
 
 
 # Log an error
@@ -144,7 +273,8 @@ def log_error(error_msg):
 
 if __name__ == '__main__':
 	print "{:<35} {:<25}".format("Main script started.", dt.now().strftime("%H:%M:%S.%f"))
-	ceiling_actuation = CeilingActuation(PHUE_IP_ADDRESS)
+	state_bus = StateBus()
+	ceiling_actuation = CeilingActuation(PHUE_IP_ADDRESS, state_bus)
 
 	# Initialize Listener, to listen to commands from the rpi_sense process.
 	sensing_address = ('localhost', 6000)
@@ -152,22 +282,5 @@ if __name__ == '__main__':
 	conn = listener.accept()
 	print "[*] Optimizer accepted connection from sensing process"
 
-	optimizer_process = None
-	while True:
-		msg = conn.recv()
-		if msg == 'Optimize':
-			print "[*] Restart optimizer"
-			if optimizer_process:
-				optimizer_process.terminate()
-			optimizer_process = Process(target=optimizer, args=(ceiling_actuation, ))
-			optimizer_process.daemon = True
-			optimizer_process.start()
-		if msg == 'Pause':
-			print "[*] Pause optimizer"
-			if optimizer_process:
-				optimizer_process.terminate()
-		elif msg == 'Close':
-			if optimizer_process:
-				optimizer_process.terminate()
-			conn.close()
-			break
+	run_optimizer(conn, ceiling_actuation, state_bus)
+	ceiling_actuation.close()
@@ -4,9 +4,11 @@ Author: Yerbol Aussat
 Python Version: 2.7
 
 This process:
-- Monitors changes in occupancy and illuminance in the office, and updates corresponding files, "cur_illum.txt" and
- "cur_occup.txt", every ~0.1 seconds.
-- Restarts optimization process whenever office occupancy changes.
+- At startup, reuses the stored illuminance model if it passes a quick validation, and calibrates the system otherwise.
+- Monitors changes in occupancy and illuminance in the office, and publishes them to the state bus (shared memory, see
+ state_bus.py) every ~0.1 seconds. Sensing modules push their readings to this process (see
+ OfficeSensing.start_streaming), so the latest readings are available without waiting for the network.
+- Sends new target illuminances to the optimization process whenever office occupancy changes.
 - Listens for incoming connection requests from the portable sensing modules, and triggers their integration into
 the system.
 
@@ -19,13 +21,12 @@ TODO:
 - Enable integrating several sensing modules into the system together (current implementation can only integrate
 one sensing module at a time).
 - Similarly, enable disconnecting several sensing modules from the system simultaneously.
-- In the current implementation, occupancy vector from "cur_occup.txt" contains occupancy values (0, 1) for "per-desk"
+- In the current implementation, occupancy vector in the state bus contains occupancy values (0, 1) for "per-desk"
 sensing modules, and target illuminances (lux) for portable sensing modules, which is confusing. This should be fixed
 to make the code more readable.
 """
 
 import time
-import os
 import numpy as np
 from datetime import datetime as dt
 import subprocess
@@ -34,46 +35,58 @@ import socket
 from multiprocessing.connection import Client
 import traceback
 from office_sensing import OfficeSensing
+from ceiling_actuation import CeilingActuation
 import rpi_calibrate as calibrator
 from portable_sensing_module import PortableSensingModule
+from state_bus import StateBus
 
 
 # Constants
 OPTIMIZE_COMMAND = "Optimize"
 PAUSE_OPTIMIZATION_COMMAND = "Pause"
 CLOSE_CONNECTION_COMMAND = "Close"
-ILLUMINANCE_FILE_NAME = "cur_illum.txt"
-OCCUPANCY_FILE_NAME = "cur_occup.txt"
 SENS_MODULE_CONFIG_FILE_NAME = 'sensing_module_list.txt'
 ILLUM_GAIN_MTX_FILE_NAME = 'illum_gain.npy'
 ENV_GAIN_FILE_NAME = 'env_gain.npy'
+SENSOR_STREAMING_RATE = 10  # Frames per second pushed by each sensing module (None - poll sensing modules instead).
+REUSE_STORED_MODEL = True  # Whether to reuse the stored illuminance model at startup, if it passes validation.
 
 
-# Keep updating sensor values and trigger optimization processes.
-def sense_and_optimize(office_sensing):
+# Send a command to the optimizer process. Commands are sent as (command, occupancy, time when the command was sent)
+# tuples; occupancy is sent with OPTIMIZE_COMMAND (the optimizer derives new target illuminances from it), and the send
+# time is used by the optimizer to measure its reaction latency.
+def send_command(conn, command, occupancy=None):
+	conn.send((command, occupancy, time.time()))
+
+
+# Keep updating sensor values and trigger optimization processes. Bulbs are set through ceiling_actuation during
+# recalibration.
+def sense_and_optimize(office_sensing, state_bus, ceiling_actuation):
 	# Start optimizer process and connect to it.
 	subprocess.call('python2 rpi_optimize.py &', shell=True)
 	address_optimizer = ('localhost', 6000)
 	conn = Client(address_optimizer, authkey='secret password')
 	print "[*] Sensing process connected to optimizer"
 
-	t1 = time.time()	
+	prev_occupancy = None
+	t1 = time.time()
 	try: 
 		while True:
 			# If there are any incoming connection requests from new portable sensing modules, pause the optimizer and
-			# integrate these new modules into the system.
+			# integrate these new modules into the system. The optimizer is resumed with new targets below (occupancy
+			# changes, since it includes the new modules).
 			if len(portable_sensing_modules) > 0:
-				conn.send(PAUSE_OPTIMIZATION_COMMAND)
+				send_command(conn, PAUSE_OPTIMIZATION_COMMAND)
 				while portable_sensing_modules:
 					module, calibr_const = portable_sensing_modules.pop()
 					office_sensing.add_portable_module(module, calibr_const)
 				print "[*] New sensing module detected. Starting recalibration."
-				calibrator.calibrate(office_sensing_modules, step=0.1, B=0.65, wait_time=0.9)
+				# Gains are measured sequentially: the room is occupied, and Hadamard patterns dim several bulbs at once.
+				calibrator.calibrate(office_sensing, ceiling_actuation, step=0.1, B=0.65, wait_time=0.9,
+				                     state_bus=state_bus)
 
 			# Get sensor readings.
-			illuminance, occupancy = office_sensing.get_sensor_readings()
-			cur_illum_str = " ".join([str(illum_val) for illum_val in illuminance])
-			cur_occup_str = " ".join([str(occup_val) for occup_val in occupancy])
+			illuminance, occupancy = office_sensing.get_latest_readings()
 
 			# Print illuminance and occupancy values every 3 seconds.
 			t2 = time.time()
@@ -84,82 +97,73 @@ def sense_and_optimize(office_sensing):
 				print_occupancy(occupancy)
 				t1 = t2
 				
-			# Update illuminance file.
-			with open(ILLUMINANCE_FILE_NAME, 'w+') as f_illum:
-				f_illum.write(cur_illum_str)
-
-			# Update occupancy file.
-			if os.path.isfile('./{}'.format(OCCUPANCY_FILE_NAME)):
-				# If occupancy file already exists, compare current occupancy with the previous one, and if they differ,
-				# restart the optimizer with the new target illuminance values.
-				with open(OCCUPANCY_FILE_NAME, 'r') as f_occup:
-					prev_occup_str = f_occup.read()
-				if prev_occup_str != cur_occup_str:
-					with open(OCCUPANCY_FILE_NAME, 'w+') as f_occup:
-						f_occup.write(cur_occup_str)
-
-					cur_occup = cur_occup_str.split(" ")
-					prev_occup = prev_occup_str.split(" ")
-
-					# Check if a portable module should be disconnected. If yes, disconnect it.
-					i = 4  # NOTE: 4 is hardcoded here.
-					while i < len(cur_occup):
-						if cur_occup[i] == '-1':
-							break
-						i += 1
-
-					if i < len(cur_occup):
-						print "\n\n", "*" * 50
-						print "[*] Disconnecting portable module {} ...".format(i)
-						conn.send(PAUSE_OPTIMIZATION_COMMAND)
-						office_sensing.detach_portable_module(i)
-						A = np.load(ILLUM_GAIN_MTX_FILE_NAME)
-						A = np.delete(A, i, 0)
-						np.save(ILLUM_GAIN_MTX_FILE_NAME, A)
-						E = np.load(ENV_GAIN_FILE_NAME)
-						E = np.delete(E, i)
-						np.save(ENV_GAIN_FILE_NAME, E)
-						continue
-
-					if len(cur_occup) == len(prev_occup):
-						if cur_occup[:4] == prev_occup[:4]:
-							# If target illuminance on portable sensing modules changed.
-							print "\n", "#" * 50, "\n", "#" * 50
-							print "\nTARGET ILLUMINANCE ON PORTABLE SENSING MODULES CHANGED.\n\n{} ==> {}\n\n" \
-							      "RESTART OPTIMIZER.\n".format(prev_occup[4:], cur_occup[4:])
-							print dt.now().strftime("%H:%M:%S.%f"), "\n"
-							print "#" * 50, "\n", "#" * 50, "\n"
-						else:
-							# If occupancy status of "per-desk" sensing modules changed.
-							print "\n", "#" * 50, "\n", "#" * 50
-							print "\nOCCUPANCY CHANGES: RESTART OPTIMIZER\n"
-							print dt.now().strftime("%H:%M:%S.%f"), "\n"
-							print_occupancy(occupancy)
-							print "#" * 50, "\n", "#" * 50, "\n"
-					conn.send(OPTIMIZE_COMMAND)  # Restart the optimizer
-				else:
-					time.sleep(0.1)
+			# Publish illuminance and occupancy values.
+			state_bus.set_sensor_readings(illuminance, occupancy)
+
+			if prev_occupancy is None:
+				# Start optimization process with the first occupancy values.
+				print "[*] Start optimization"
+				prev_occupancy = occupancy
+				send_command(conn, OPTIMIZE_COMMAND, occupancy)
+			elif occupancy != prev_occupancy:
+				# If current occupancy differs from the previous one, restart the optimizer with the new target
+				# illuminance values.
+				cur_occup, prev_occup = occupancy, prev_occupancy
+				prev_occupancy = occupancy
+
+				# Check if a portable module should be disconnected. If yes, disconnect it.
+				i = 4  # NOTE: 4 is hardcoded here.
+				while i < len(cur_occup):
+					if cur_occup[i] == -1:
+						break
+					i += 1
+
+				if i < len(cur_occup):
+					print "\n\n", "*" * 50
+					print "[*] Disconnecting portable module {} ...".format(i)
+					send_command(conn, PAUSE_OPTIMIZATION_COMMAND)
+					office_sensing.detach_portable_module(i)
+					A, E = state_bus.get_model()
+					A = np.delete(A, i, 0)
+					E = np.delete(E, i)
+					np.save(ILLUM_GAIN_MTX_FILE_NAME, A)
+					np.save(ENV_GAIN_FILE_NAME, E)
+					state_bus.set_model(A, E)
+					continue
+
+				if len(cur_occup) == len(prev_occup):
+					if cur_occup[:4] == prev_occup[:4]:
+						# If target illuminance on portable sensing modules changed.
+						print "\n", "#" * 50, "\n", "#" * 50
+						print "\nTARGET ILLUMINANCE ON PORTABLE SENSING MODULES CHANGED.\n\n{} ==> {}\n\n" \
+						      "UPDATE OPTIMIZER TARGETS.\n".format(prev_occup[4:], cur_occup[4:])
+						print dt.now().strftime("%H:%M:%S.%f"), "\n"
+						print "#" * 50, "\n", "#" * 50, "\n"
+					else:
+						# If occupancy status of "per-desk" sensing modules changed.
+						print "\n", "#" * 50, "\n", "#" * 50
+						print "\nOCCUPANCY CHANGES: UPDATE OPTIMIZER TARGETS\n"
+						print dt.now().strftime("%H:%M:%S.%f"), "\n"
+						print_occupancy(occupancy)
+						print "#" * 50, "\n", "#" * 50, "\n"
+				send_command(conn, OPTIMIZE_COMMAND, occupancy)  # Send new targets to the optimizer
 			else:
-				# If occupancy file does not exist, create it, and start optimization process.
-				print "CREATE {} file".format(OCCUPANCY_FILE_NAME)
-				with open(OCCUPANCY_FILE_NAME, 'w+') as f_occup:
-					f_occup.write(cur_occup_str)
-				conn.send(OPTIMIZE_COMMAND)
+				time.sleep(0.1)
 
 	except KeyboardInterrupt:
 		print "\nScript Interrupted"
 		office_sensing.stop_sens_modules()
-		conn.send(CLOSE_CONNECTION_COMMAND)  # Close connection with optimizer.
+		send_command(conn, CLOSE_CONNECTION_COMMAND)  # Close connection with optimizer.
 		conn.close()
-		subprocess.call('rm {}'.format(OCCUPANCY_FILE_NAME), shell=True)
+		state_bus.reset()
 
 	except Exception, e:  # Stop sensing modules if there is an exception.
 		office_sensing.stop_sens_modules()
 		print "Exception:\n", str(e)
 		traceback.print_exc()
-		conn.send(CLOSE_CONNECTION_COMMAND)  # Close connection with optimizer.
+		send_command(conn, CLOSE_CONNECTION_COMMAND)  # Close connection with optimizer.
 		conn.close()
-		subprocess.call('rm {}'.format(OCCUPANCY_FILE_NAME), shell=True)
+		state_bus.reset()
 
 
 # Print illuminance values on each sensor. Note: this method assumes an arrangement of "per-desk" sensing
@@ -225,19 +229,34 @@ def listen_for_connection(portable_modules):
 		client, addr = server.accept()
 		print "\n\n", "*" * 50
 		print "[*] Got connection request from", addr[0], ":", addr[1]
-		module = PortableSensingModule(client)
-		calibr_const = float(client.recv(1024))
+		# Portable sensing module sends its light calibration constant (and the protocol version it supports, if any).
+		connection_info = client.recv(1024).split()
+		calibr_const = float(connection_info[0])
+		protocol_version = int(connection_info[1]) if len(connection_info) > 1 else None
+		module = PortableSensingModule(client, protocol_version)
 		portable_modules.append((module, calibr_const))
 
 
 if __name__ == '__main__':
+	# Shared-memory state bus, through which this process and the optimizer process exchange the state of the system.
+	state_bus = StateBus()
+	state_bus.reset()
+
 	addresses, light_calibration_const = get_sens_module_config()
 	office_sensing_modules = OfficeSensing(addresses, light_calibration_const)
-	calibrator.calibrate(office_sensing_modules, initial_calibration=True)
+	if SENSOR_STREAMING_RATE:
+		office_sensing_modules.start_streaming(SENSOR_STREAMING_RATE)
+	# Bulbs are set by this process only during calibration, through one CeilingActuation for the process lifetime.
+	ceiling_actuation = CeilingActuation(calibrator.PHUE_IP_ADDRESS, state_bus)
+	if REUSE_STORED_MODEL:
+		calibrator.initialize_model(office_sensing_modules, ceiling_actuation, state_bus=state_bus)
+	else:
+		calibrator.calibrate(office_sensing_modules, ceiling_actuation, initial_calibration=True, state_bus=state_bus)
 	portable_sensing_modules = []
 
 	thread = Thread(target=listen_for_connection, args=(portable_sensing_modules, ))
 	thread.daemon = True
 	thread.start()
 
-	sense_and_optimize(office_sensing_modules)
+	sense_and_optimize(office_sensing_modules, state_bus, ceiling_actuation)
+	ceiling_actuation.close()
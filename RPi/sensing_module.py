@@ -4,24 +4,104 @@ Author: Yerbol Aussat
 Python Version: 2.7
 
 SensingModule class initializes connection with a sensing module, and defines methods for communication with it.
+
+Sensing modules that support the binary protocol (see sensing_protocol.py) are communicated with using it. The legacy
+text protocol is used for other sensing modules.
 """
 
 import socket
+import sensing_protocol as protocol
 
 
 class SensingModule:
 	def __init__(self, ip, port):
 		# IPV-4 address, TCP-oriented socket.
-		self.client = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+		client = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
 		self.ip = ip
 		self.port = port
-		self.client.connect((ip, port))
-		
-	# Send a message msg to the sensing module.
+		client.connect((ip, port))
+		self._setup_connection(client)
+
+	# Set up communication over a connected socket. Until the protocol version is known (see check_connection), the
+	# legacy text protocol is used.
+	def _setup_connection(self, client, protocol_version=None):
+		self.client = client
+		# Send small messages right away, instead of delaying them to coalesce with subsequent ones (Nagle's algorithm).
+		self.client.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+		self.protocol_version = protocol_version
+		self.reader = protocol.MessageReader(client)
+		self.streaming = False
+
+	# Check if the binary protocol is used to communicate with the sensing module.
+	def is_binary(self):
+		return self.protocol_version == protocol.PROTOCOL_VERSION
+
+	# Send a message msg to the sensing module (legacy text protocol).
 	def send_msg(self, msg):
 		self.client.send(msg)
 		return self.client.recv(1024)
-	
-	# Disconnect from the sensing module.
+
+	# Check connection with the sensing module, and find out which protocol it supports.
+	def check_connection(self):
+		reply = self.send_msg("Check connection")
+		self.protocol_version = protocol.get_protocol_version(reply)
+		return reply
+
+	# Get sensor readings: (light reading, occupancy reading or user lux preference).
+	def read(self):
+		if self.is_binary():
+			self.client.send(protocol.pack_frame(protocol.MSG_READ))
+			_, light_reading, second_reading = self.__recv_reading()
+			return light_reading, second_reading
+		light_reading, second_reading = self.send_msg("Read").split()
+		return int(light_reading), int(second_reading)
+
+	# Receive a frame with sensor readings (binary protocol): (timestamp, light reading, second reading).
+	# Returns None if the sensing module closed the connection, or said goodbye.
+	def __recv_reading(self, expected=True):
+		frame = self.reader.read_frame()
+		if frame is None or frame[0] == protocol.MSG_GOODBYE:
+			if expected:
+				raise IOError("Connection with sensing module is closed")
+			return None
+		msg_type, payload = frame
+		if msg_type != protocol.MSG_READING:
+			raise ValueError('Unexpected message type {}'.format(msg_type))
+		return protocol.READING_RECORD.unpack(payload)
+
+	# Subscribe to sensor readings, which are then pushed by the sensing module at the given rate (frames per second).
+	def subscribe(self, rate):
+		if self.is_binary():
+			self.client.send(protocol.pack_frame(protocol.MSG_SUBSCRIBE, protocol.RATE_RECORD.pack(rate)))
+		else:
+			self.client.send("Subscribe {}".format(rate))
+		self.streaming = True
+
+	# Receive the next pushed frame: (timestamp, light reading, occupancy reading or user lux preference).
+	# Returns None when the stream is over (i.e., the sensing module closed the connection).
+	def recv_frame(self):
+		if self.is_binary():
+			frame = self.__recv_reading(expected=False)
+		else:
+			# Text frames are newline-delimited.
+			line = self.reader.read_line()
+			if line is not None:
+				timestamp, light_reading, second_reading = line.split()
+				frame = float(timestamp), int(light_reading), int(second_reading)
+			else:
+				frame = None
+		if frame is None:
+			self.streaming = False
+		return frame
+
+	# Disconnect from the sensing module. In push mode, the reply is consumed by the thread that receives pushed frames
+	# (see OfficeSensing.start_streaming).
 	def disconnect(self):
-		self.send_msg("disconnect")
+		if self.is_binary():
+			self.client.send(protocol.pack_frame(protocol.MSG_DISCONNECT))
+			if not self.streaming:
+				self.reader.read_frame()
+		elif self.streaming:
+			self.client.send("disconnect")
+		else:
+			self.send_msg("disconnect")
@@ -0,0 +1,93 @@
+"""
+File name: settle_detection.py
+Author: Yerbol Aussat
+Python Version: 2.7
+
+SettleDetector class waits until illuminance settles after dimming levels change (instead of sleeping for a fixed time
+that is tuned for the slowest case). It polls sensor readings at a high rate, and returns as soon as readings of every
+sensor stay within a tolerance over a time window. The fixed time that was used before is the upper bound of the wait.
+
+Light sensors integrate light over a period (TSL2561 integration time, 101 ms on the sensing modules, see
+Omega/omega_module.py), so readings form a staircase: they only change once per integration period, and are repeated in
+between. Timing of the detector is derived from the sensor update period:
+- the window covers at least MIN_SENSOR_PERIODS sensor update periods, so that it contains several distinct sensor
+values (a shorter window may only contain repeats of one value, and pass as stable while the bulbs are still changing);
+- readings are not checked before min_wait, which covers two sensor update periods and the delay until readings reach
+the detector (bulbs may not start changing right after the bridge acknowledges new dimming levels, and the first
+readings that reflect the change arrive after that), so that the window doesn't end before the change shows up.
+A wait that is too short for readings to be checked is a plain sleep.
+"""
+
+import time
+from collections import deque
+import numpy as np
+
+# Constants
+DEFAULT_TOLERANCE = 5.0  # lux
+DEFAULT_RELATIVE_TOLERANCE = 0.02  # Fraction of the readings (if it's larger than the tolerance in lux).
+DEFAULT_WINDOW = 0.3  # seconds
+DEFAULT_SENSOR_PERIOD = 0.101  # seconds (how often sensor readings change: TSL2561 integration time).
+# Max delay of readings (light sampling thread of a sensing module, push frames, and state bus updates, 0.1 s each).
+DEFAULT_SENSOR_DELAY = 0.3  # seconds
+MIN_SENSOR_PERIODS = 3  # Min number of sensor update periods that the window covers.
+DEFAULT_POLL_PERIOD = 0.05  # seconds
+DEFAULT_MIN_WAIT = 0.4  # seconds
+
+
+class SettleDetector:
+	# read_fn() should return the current sensor readings (lux), or None if they are not available.
+	# The window and min_wait are extended to the ones derived from sensor_period and sensor_delay, if they are shorter.
+	def __init__(self, read_fn, tolerance=DEFAULT_TOLERANCE, relative_tolerance=DEFAULT_RELATIVE_TOLERANCE,
+	             window=DEFAULT_WINDOW, poll_period=DEFAULT_POLL_PERIOD, min_wait=DEFAULT_MIN_WAIT,
+	             sensor_period=DEFAULT_SENSOR_PERIOD, sensor_delay=DEFAULT_SENSOR_DELAY):
+		self.read_fn = read_fn
+		self.tolerance = tolerance
+		self.relative_tolerance = relative_tolerance
+		self.window = max(window, MIN_SENSOR_PERIODS * sensor_period + poll_period)
+		self.poll_period = poll_period
+		self.min_wait = max(min_wait, 2 * sensor_period + sensor_delay)
+		self.last_wait_time = None  # Duration of the last wait (s).
+
+	# Get the shortest time after which readings can be reported as settled.
+	def get_min_settle_time(self):
+		return max(self.min_wait, self.window)
+
+	# Wait until readings settle, for at most max_wait seconds since start (default - now). Returns True if readings
+	# settled, and False if the wait timed out, or was stopped (polling stops as soon as stop_fn() returns True).
+	def wait(self, max_wait, start=None, stop_fn=None):
+		start = time.time() if start is None else start
+		if max_wait <= self.get_min_settle_time():
+			# Readings can't be checked before the wait ends.
+			while time.time() - start < max_wait and not (stop_fn and stop_fn()):
+				time.sleep(min(self.poll_period, max(0, start + max_wait - time.time())))
+			self.last_wait_time = time.time() - start
+			return False
+		samples = deque()  # (time, readings) within the window, and the last one before it.
+		while True:
+			now = time.time()
+			self.last_wait_time = now - start
+			if now - start >= max_wait or (stop_fn and stop_fn()):
+				return False
+
+			readings = self.read_fn()
+			now = time.time()
+			if readings is None:
+				samples.clear()
+				time.sleep(self.poll_period)
+				continue
+			readings = np.asarray(readings, dtype=float)
+			if samples and samples[-1][1].shape != readings.shape:
+				samples.clear()  # Sensors were added or removed.
+			samples.append((now, readings))
+			while len(samples) > 1 and samples[1][0] <= now - self.window:
+				samples.popleft()
+			if now - start >= self.min_wait and now - samples[0][0] >= self.window and self.__is_stable(samples):
+				self.last_wait_time = now - start
+				return True
+			time.sleep(min(self.poll_period, max(0, start + max_wait - time.time())))
+
+	# Check if readings of every sensor stay within the tolerance.
+	def __is_stable(self, samples):
+		readings = np.array([sample_readings for _, sample_readings in samples])
+		spread = readings.max(axis=0) - readings.min(axis=0)
+		return (spread <= np.maximum(self.tolerance, self.relative_tolerance * np.abs(readings.mean(axis=0)))).all()
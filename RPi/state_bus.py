@@ -0,0 +1,139 @@
+"""
+File name: state_bus.py
+Author: Yerbol Aussat
+Python Version: 2.7
+
+StateBus class is a shared-memory segment through which the processes of the control module (rpi_sense.py and
+rpi_optimize.py) exchange the state of the system:
+- illuminance readings and occupancy values (target illuminances for portable sensing modules);
+- dimming levels of bulbs;
+- illuminance model: illuminance gains matrix A and environmental illuminance gains E.
+
+The segment is a file that is memory-mapped by every process (it is created in /dev/shm, so it resides in memory).
+Readers take consistent snapshots without locking, using a sequence counter (seqlock): a writer increments the counter
+before and after writing (so it is odd while a write is in progress), and a reader retries if the counter was odd, or
+changed while it was reading. Writers are serialized with a file lock (they can be in different processes).
+"""
+
+import os
+import time
+import fcntl
+import numpy as np
+from threading import Lock
+
+# Constants
+MAX_SENSING_MODULES = 16
+MAX_BULBS = 8
+STATE_BUS_FILE_NAME = '/dev/shm/smart_lighting_state' if os.path.isdir('/dev/shm') else 'smart_lighting_state.bin'
+
+# Layout of the shared-memory segment. Lengths of the stored vectors are kept in separate fields (0 - not set yet).
+STATE_DTYPE = np.dtype([
+	('seq', np.uint64),
+	('n_illuminance', np.int64),
+	('illuminance', np.float64, (MAX_SENSING_MODULES, )),
+	('n_occupancy', np.int64),
+	('occupancy', np.int64, (MAX_SENSING_MODULES, )),
+	('n_dim_levels', np.int64),
+	('dim_levels', np.float64, (MAX_BULBS, )),
+	('model_shape', np.int64, (2, )),
+	('illum_gain', np.float64, (MAX_SENSING_MODULES, MAX_BULBS)),
+	('env_gain', np.float64, (MAX_SENSING_MODULES, )),
+	('illum_gain_version', np.int64),  # Incremented whenever matrix A changes.
+])
+
+
+class StateBus:
+	def __init__(self, file_name=STATE_BUS_FILE_NAME):
+		# Create the segment if it doesn't exist yet (its contents are zeros, i.e., nothing is set).
+		self.fd = os.open(file_name, os.O_RDWR | os.O_CREAT, 0o644)
+		if os.fstat(self.fd).st_size < STATE_DTYPE.itemsize:
+			os.ftruncate(self.fd, STATE_DTYPE.itemsize)
+		self.state = np.memmap(file_name, dtype=STATE_DTYPE, mode='r+', shape=(1, ))
+		# Views of the fields (scalar fields are viewed as 1-element arrays, so that they can be written in place).
+		self.fields = {}
+		for name in STATE_DTYPE.names:
+			self.fields[name] = self.state[name][0] if STATE_DTYPE[name].shape else self.state[name]
+		self.seq = self.fields.pop('seq')
+		self.lock = Lock()
+
+	# Write fields of the state: fields is a list of (field name, index, value) tuples.
+	def __write(self, fields, illum_gain_changed=False):
+		with self.lock:
+			fcntl.flock(self.fd, fcntl.LOCK_EX)
+			try:
+				# If the counter is odd, a writer was killed in the middle of a write; make it even again, so that
+				# readers don't wait for this write forever.
+				self.seq[0] += 1 if self.seq[0] % 2 == 0 else 2
+				try:
+					for name, index, value in fields:
+						self.fields[name][index] = value
+					if illum_gain_changed:
+						self.fields['illum_gain_version'] += 1
+				finally:
+					# Make the counter even even if the write failed (e.g., a value of a wrong shape).
+					self.seq[0] += 1
+			finally:
+				fcntl.flock(self.fd, fcntl.LOCK_UN)
+
+	# Take a consistent snapshot of the state: read_fn copies the needed fields, and is repeated if a write happened
+	# while it was running.
+	def __read(self, read_fn):
+		while True:
+			seq = int(self.seq[0])
+			if seq % 2 == 0:
+				result = read_fn(self.fields)
+				if int(self.seq[0]) == seq:
+					return result
+			time.sleep(0.0001)
+
+	# Clear the state.
+	def reset(self):
+		self.__write([(name, Ellipsis, 0) for name in self.fields if name != 'illum_gain_version'])
+
+	# Store illuminance and occupancy values (readings of sensing modules).
+	def set_sensor_readings(self, illuminance, occupancy):
+		n = len(illuminance)
+		self.__write([('illuminance', slice(0, n), illuminance), ('n_illuminance', Ellipsis, n),
+		              ('occupancy', slice(0, len(occupancy)), occupancy), ('n_occupancy', Ellipsis, len(occupancy))])
+
+	# Get illuminance values (None if they are not set).
+	def get_illuminance(self):
+		illuminance = self.__read(lambda fields: np.array(fields['illuminance'][:int(fields['n_illuminance'])]))
+		return illuminance if len(illuminance) else None
+
+	# Get occupancy values (None if they are not set).
+	def get_occupancy(self):
+		occupancy = self.__read(lambda fields: fields['occupancy'][:int(fields['n_occupancy'])].tolist())
+		return occupancy if occupancy else None
+
+	# Store dimming levels of bulbs.
+	def set_dim_levels(self, dim_levels):
+		n = len(dim_levels)
+		self.__write([('dim_levels', slice(0, n), dim_levels), ('n_dim_levels', Ellipsis, n)])
+
+	# Get dimming levels of bulbs (None if they are not set).
+	def get_dim_levels(self):
+		dim_levels = self.__read(lambda fields: fields['dim_levels'][:int(fields['n_dim_levels'])].tolist())
+		return dim_levels if dim_levels else None
+
+	# Store illuminance gains matrix A, and environmental illuminance gains E.
+	def set_model(self, A, E):
+		n_sensors, n_bulbs = A.shape
+		self.__write([('illum_gain', (slice(0, n_sensors), slice(0, n_bulbs)), A), ('env_gain', slice(0, len(E)), E),
+		              ('model_shape', Ellipsis, A.shape)], illum_gain_changed=True)
+
+	# Store environmental illuminance gains E (matrix A stays the same).
+	def set_env_gain(self, E):
+		self.__write([('env_gain', slice(0, len(E)), E)])
+
+	# Get illuminance gains matrix A and environmental illuminance gains E ((None, None) if they are not set).
+	def get_model(self):
+		def read_model(fields):
+			n_sensors, n_bulbs = fields['model_shape']
+			return np.array(fields['illum_gain'][:n_sensors, :n_bulbs]), np.array(fields['env_gain'][:n_sensors])
+		A, E = self.__read(read_model)
+		return (A, E) if A.size else (None, None)
+
+	# Get version of matrix A (it changes whenever A changes, e.g., after calibration).
+	def get_illum_gain_version(self):
+		return self.__read(lambda fields: int(fields['illum_gain_version']))